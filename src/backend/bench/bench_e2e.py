@@ -0,0 +1,369 @@
+"""
+End-to-end ingestion benchmark: synthetic telemetry -> MQTT -> backend -> InfluxDB writes.
+
+Runs the real FastAPI lifespan (paho client, dispatcher, ingestion, Influx
+writer) against two in-process stand-ins, so it works offline:
+  - a minimal MQTT 3.1.1 broker (CONNECT, SUBSCRIBE, PUBLISH QoS 0/1, PING)
+  - a fake InfluxDB HTTP API accepting line-protocol writes and empty queries
+
+Every reading carries its sequence number as value; the fake Influx maps
+written points back to their publish time to measure ingest-to-store latency.
+Each rate runs as one phase of --duration seconds, then the pipeline gets
+--drain seconds to catch up before counting what was stored.
+The publisher shares this process: when publish_rate stays below the
+requested rate, the machine (not the backend) is the limit.
+
+Usage (from src/backend):
+    python bench/bench_e2e.py [--rates 500 2000 8000] [--sensors 50] [--duration 10]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Dict, List, Optional
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+sys.path.insert(0, SRC)
+
+METRICS = ["temperature", "pressure", "sound", "distance", "humidity"]
+
+# MQTT 3.1.1 packet types (high nibble of the fixed header)
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def encode_length(length: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        out.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(out)
+
+
+def mqtt_string(value: str) -> bytes:
+    data = value.encode()
+    return len(data).to_bytes(2, "big") + data
+
+
+class MiniBroker:
+    """Just enough of an MQTT 3.1.1 broker for one backend client, on its own event loop thread"""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.loop = asyncio.new_event_loop()
+        self.subscribers: Dict[asyncio.StreamWriter, List[str]] = {}
+        self.subscribed = threading.Event()
+        self._server = None
+        self._router = None
+
+    def start(self):
+        from services.topic_router import TopicRouter
+        self._router = TopicRouter()
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self._server = self.loop.run_until_complete(
+                asyncio.start_server(self._handle, "127.0.0.1", self.port)
+            )
+            ready.set()
+            self.loop.run_forever()
+
+        threading.Thread(target=run, name="bench-broker", daemon=True).start()
+        ready.wait()
+
+    def run(self, coro):
+        """Run a coroutine on the broker loop from another thread and wait for it"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def publish(self, topic: str, payload: bytes):
+        """Fan a message out to matching subscribers (broker loop only), without draining"""
+        packet = self._publish_packet(topic, payload)
+        for writer in self._router.match(topic):
+            writer.write(packet)
+
+    async def drain(self):
+        for writer in list(self.subscribers):
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    @staticmethod
+    def _publish_packet(topic: str, payload: bytes) -> bytes:
+        body = mqtt_string(topic) + payload
+        return bytes([PUBLISH << 4]) + encode_length(len(body)) + body
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.subscribers[writer] = []
+        try:
+            while True:
+                header = await reader.readexactly(1)
+                length, multiplier = 0, 1
+                while True:
+                    byte = (await reader.readexactly(1))[0]
+                    length += (byte & 0x7F) * multiplier
+                    multiplier *= 128
+                    if not byte & 0x80:
+                        break
+                body = await reader.readexactly(length)
+                if not self._on_packet(writer, header[0], body):
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for filter in self.subscribers.pop(writer, []):
+                self._router.remove(filter, writer)
+            writer.close()
+
+    def _on_packet(self, writer: asyncio.StreamWriter, first: int, body: bytes) -> bool:
+        kind = first >> 4
+        if kind == CONNECT:
+            writer.write(bytes([CONNACK << 4, 2, 0, 0]))
+        elif kind == SUBSCRIBE:
+            packet_id, offset, granted = body[:2], 2, bytearray()
+            while offset < len(body):
+                size = int.from_bytes(body[offset:offset + 2], "big")
+                filter = body[offset + 2:offset + 2 + size].decode()
+                offset += 3 + size
+                self.subscribers[writer].append(filter)
+                self._router.add(filter, writer)
+                granted.append(0)
+            writer.write(bytes([SUBACK << 4]) + encode_length(2 + len(granted)) + packet_id + bytes(granted))
+            self.subscribed.set()
+        elif kind == UNSUBSCRIBE:
+            writer.write(bytes([UNSUBACK << 4, 2]) + body[:2])
+        elif kind == PUBLISH:
+            qos = (first >> 1) & 0x03
+            size = int.from_bytes(body[:2], "big")
+            topic = body[2:2 + size].decode()
+            offset = 2 + size
+            if qos:
+                writer.write(bytes([PUBACK << 4, 2]) + body[offset:offset + 2])
+                offset += 2
+            self.publish(topic, body[offset:])
+        elif kind == PINGREQ:
+            writer.write(bytes([PINGRESP << 4, 0]))
+        elif kind == DISCONNECT:
+            return False
+        return True
+
+
+class InfluxStandIn:
+    """Fake InfluxDB v2 HTTP API, recording when each written sequence number arrived"""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.lock = threading.Lock()
+        self.stored: Dict[int, float] = {}
+        self.writes = 0
+
+    def start(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *_):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path.startswith("/api/v2/write"):
+                    stand_in.record(body, time.perf_counter())
+                    self.send_response(204)
+                    self.end_headers()
+                    return
+                if self.path.startswith("/api/v2/query"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/csv")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(404)
+                self.end_headers()
+
+            def do_GET(self):
+                self.send_response(204 if self.path.startswith(("/ping", "/health")) else 404)
+                self.end_headers()
+
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        server = Server(("127.0.0.1", self.port), Handler)
+        threading.Thread(target=server.serve_forever, name="bench-influx", daemon=True).start()
+
+    def record(self, body: bytes, arrived: float):
+        seqs = []
+        for line in body.decode().splitlines():
+            # telemetry,metric=..,room=..,sensor_id=.. value=<seq> <ts>
+            parts = line.split(" ")
+            if len(parts) >= 2 and parts[1].startswith("value="):
+                seqs.append(int(float(parts[1][6:])))
+        with self.lock:
+            self.writes += 1
+            for seq in seqs:
+                self.stored.setdefault(seq, arrived)
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def memory_mb() -> Dict[str, Optional[float]]:
+    """Current and peak resident memory of this process"""
+    memory = {"rss_mb": None, "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    memory["rss_mb"] = int(line.split()[1]) / 1024
+                elif line.startswith("VmHWM:"):
+                    memory["peak_rss_mb"] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return {key: round(value, 1) if value is not None else None for key, value in memory.items()}
+
+
+async def replay(broker: MiniBroker, rate: int, sensors: int, duration: float, first_seq: int,
+                 sent_at: Dict[int, float]) -> int:
+    """Publish rate msg/s for duration seconds in 10 ms ticks, returns the next sequence number"""
+    tick = 0.01
+    seq = first_seq
+    base_ts = int(time.time() * 1000)
+    started = time.perf_counter()
+    sent = 0
+    while True:
+        elapsed = time.perf_counter() - started
+        due = int(min(elapsed + tick, duration) * rate)
+        while sent < due:
+            sensor = seq % sensors
+            payload = json.dumps({
+                "room": f"R{sensor % 10}",
+                "sensor_id": f"bench-{sensor}",
+                "metric": METRICS[sensor % len(METRICS)],
+                "value": seq,
+                "ts": base_ts + seq,
+            }).encode()
+            sent_at[seq] = time.perf_counter()
+            broker.publish(f"sensors/bench-{sensor}/telemetry", payload)
+            seq += 1
+            sent += 1
+        await broker.drain()
+        if elapsed + tick >= duration:
+            return seq
+        await asyncio.sleep(max(0.0, started + elapsed + tick - time.perf_counter()))
+
+
+async def run_bench(args, broker: MiniBroker, influx: InfluxStandIn) -> List[Dict[str, object]]:
+    from main import app, lifespan
+    from services.influx_service import influx_service
+    from services.mqtt_service import mqtt_service
+
+    results = []
+    async with lifespan(app):
+        if not broker.subscribed.wait(timeout=10):
+            raise SystemExit("backend never subscribed to the bench broker")
+
+        seq = 0
+        for rate in args.rates:
+            sent_at: Dict[int, float] = {}
+            first = seq
+            dispatch_before = mqtt_service.dispatcher.stats()
+            writer_before = influx_service.write_stats()
+            writes_before = influx.writes
+
+            started = time.perf_counter()
+            seq = await asyncio.to_thread(broker.run, replay(broker, rate, args.sensors, args.duration, seq, sent_at))
+            published_s = time.perf_counter() - started
+
+            # Let the queues drain, stopping early once everything is stored
+            deadline = time.perf_counter() + args.drain
+            while time.perf_counter() < deadline:
+                with influx.lock:
+                    done = sum(1 for s in range(first, seq) if s in influx.stored)
+                if done == seq - first:
+                    break
+                await asyncio.sleep(0.1)
+
+            with influx.lock:
+                arrivals = {s: influx.stored[s] for s in range(first, seq) if s in influx.stored}
+            latencies = [arrivals[s] - sent_at[s] for s in arrivals]
+            stored_span = (max(arrivals.values()) - started) if arrivals else None
+            dispatch = mqtt_service.dispatcher.stats()
+            writer = influx_service.write_stats()
+            results.append({
+                "rate": rate,
+                "published": seq - first,
+                "publish_rate": round((seq - first) / published_s),
+                "stored": len(arrivals),
+                "lost": seq - first - len(arrivals),
+                "throughput": round(len(arrivals) / stored_span) if stored_span else 0,
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+                "dispatch_dropped": dispatch["dropped"] - dispatch_before["dropped"],
+                "writer_dropped": writer["dropped"] - writer_before["dropped"],
+                "influx_requests": influx.writes - writes_before,
+                **memory_mb(),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rates", type=int, nargs="+", default=[500, 2000, 8000], help="messages per second, one phase each")
+    parser.add_argument("--sensors", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per phase")
+    parser.add_argument("--drain", type=float, default=10.0, help="max seconds to wait for the pipeline after each phase")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    broker = MiniBroker(free_port())
+    influx = InfluxStandIn(free_port())
+    broker.start()
+    influx.start()
+
+    # Settings are read at import time, point them at the stand-ins first
+    os.environ.update({
+        "MQTT_HOST": "127.0.0.1",
+        "MQTT_PORT": str(broker.port),
+        "INFLUX_URL": f"http://127.0.0.1:{influx.port}",
+        "INFLUX_TOKEN": "bench",
+        "MQTT_TELEMETRY_SOURCE": "telemetry",
+        "DEBUG": "false",
+        # The stand-in only takes writes: no rollup buckets, and no spool left behind in the working directory
+        "ROLLUP_RESOLUTIONS": "",
+        "SPOOL_DIR": "",
+    })
+
+    results = asyncio.run(run_bench(args, broker, influx))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    columns = ["rate", "publish_rate", "stored", "lost", "throughput", "p50_ms", "p99_ms",
+               "dispatch_dropped", "writer_dropped", "influx_requests", "rss_mb", "peak_rss_mb"]
+    print(" ".join(f"{c:>16}" for c in columns))
+    for result in results:
+        print(" ".join(f"{str(result[c]):>16}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
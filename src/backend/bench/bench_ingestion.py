@@ -0,0 +1,126 @@
+"""
+Micro-benchmark: telemetry ingestion, legacy handlers vs the ingestion pipeline.
+
+legacy:   bytes -> str -> json.loads, then the former per-source handlers of main.py
+pipeline: loads() straight from bytes (orjson when installed), then the source normalizer
+
+Usage (from src/backend):
+    python bench/bench_ingestion.py [--messages 200000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from services.ingestion import ECOGUARD, TELEMETRY, IngestionPipeline, loads  # noqa: E402
+
+ROOMS = [f"R{i}" for i in range(20)]
+METRICS = ["temperature", "pressure", "sound", "distance", "humidity"]
+
+
+def build_messages(count: int):
+    messages = []
+    for i in range(count):
+        room = random.choice(ROOMS)
+        metric = random.choice(METRICS)
+        if random.random() < 0.5:
+            payload = {
+                "room": room,
+                "sensor_id": f"dev-{random.randint(0, 499)}",
+                "metric": metric,
+                "value": round(random.uniform(0, 100), 2),
+                "ts": 1700000000 + i,
+            }
+            messages.append(("telemetry", json.dumps(payload).encode()))
+        else:
+            payload = {
+                "room_id": room,
+                "device_id": f"eg-{random.randint(0, 99)}",
+                "parent_device_id": "hub-1",
+                "sensor_type": metric,
+                "value": round(random.uniform(0, 100), 2),
+                "unit": "x",
+                "timestamp": 1700000000000 + i,
+            }
+            messages.append(("ecoguard", json.dumps(payload).encode()))
+    return messages
+
+
+def legacy_telemetry(data):
+    room = data.get("room")
+    sensor_id = data.get("sensor_id")
+    metric = data.get("metric")
+    value = data.get("value")
+    ts = data.get("ts")
+    try:
+        value_number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not all([room, sensor_id, metric]) or value is None:
+        return None
+    return room, sensor_id, metric, value_number, ts
+
+
+def legacy_ecoguard(data):
+    room = data.get("room_id") or data.get("room")
+    sensor_id = data.get("device_id") or data.get("sensor_id") or data.get("parent_device_id")
+    metric = data.get("sensor_type") or data.get("metric")
+    value = data.get("value", data.get("amplitude"))
+    ts = data.get("timestamp") or data.get("ts")
+    if not all([room, sensor_id, metric]) or value is None:
+        return None
+    try:
+        value_number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return room, sensor_id, metric, value_number, ts
+
+
+def bench_legacy(messages):
+    handlers = {"telemetry": legacy_telemetry, "ecoguard": legacy_ecoguard}
+    accepted = 0
+    start = time.perf_counter()
+    for source, raw in messages:
+        payload = json.loads(raw.decode("utf-8"))
+        if handlers[source](payload) is not None:
+            accepted += 1
+    return time.perf_counter() - start, accepted
+
+
+def bench_pipeline(messages):
+    pipeline = IngestionPipeline()
+    handlers = {"telemetry": pipeline.handler(TELEMETRY), "ecoguard": pipeline.handler(ECOGUARD)}
+    start = time.perf_counter()
+    for source, raw in messages:
+        handlers[source]("bench", loads(raw), raw)
+    elapsed = time.perf_counter() - start
+    return elapsed, sum(counters["ingested"] for counters in pipeline.stats().values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    messages = build_messages(args.messages)
+
+    legacy_s, legacy_accepted = bench_legacy(messages)
+    pipeline_s, pipeline_accepted = bench_pipeline(messages)
+    if legacy_accepted != pipeline_accepted:
+        raise SystemExit(f"accepted count mismatch: legacy={legacy_accepted} pipeline={pipeline_accepted}")
+
+    print(f"{'path':>9} {'us/msg':>8} {'msg/s':>10}")
+    for name, elapsed in (("legacy", legacy_s), ("pipeline", pipeline_s)):
+        print(f"{name:>9} {elapsed / len(messages) * 1e6:>8.2f} {len(messages) / elapsed:>10.0f}")
+    print(f"speedup: {legacy_s / pipeline_s:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
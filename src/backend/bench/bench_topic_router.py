@@ -0,0 +1,100 @@
+"""
+Micro-benchmark: trie topic router vs the linear `_matches_topic` scan.
+
+Usage (from src/backend):
+    python bench/bench_topic_router.py [--filters 200] [--topics 20000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from services.mqtt_service import MQTTService  # noqa: E402
+from services.topic_router import TopicRouter  # noqa: E402
+
+ROOMS = [f"R{i}" for i in range(20)]
+METRICS = ["temperature", "pressure", "sound", "distance", "humidity"]
+
+
+def build_filters(count: int):
+    base = [
+        "sensors/+/telemetry",
+        "ecoguard/sensors/+/+",
+        "status/#",
+        "actuators/+/ack",
+    ]
+    filters = list(base)
+    while len(filters) < count:
+        kind = random.random()
+        room = random.choice(ROOMS)
+        metric = random.choice(METRICS)
+        if kind < 0.4:
+            filters.append(f"ecoguard/sensors/{room}/{metric}")
+        elif kind < 0.7:
+            filters.append(f"ecoguard/sensors/{room}/+")
+        elif kind < 0.9:
+            filters.append(f"sensors/dev-{random.randint(0, 499)}/telemetry")
+        else:
+            filters.append(f"rooms/{room}/#")
+    return filters
+
+
+def build_topics(count: int):
+    topics = []
+    for _ in range(count):
+        if random.random() < 0.5:
+            topics.append(f"ecoguard/sensors/{random.choice(ROOMS)}/{random.choice(METRICS)}")
+        else:
+            topics.append(f"sensors/dev-{random.randint(0, 499)}/telemetry")
+    return topics
+
+
+def bench_linear(filters, topics):
+    matches = 0
+    start = time.perf_counter()
+    for topic in topics:
+        for f in filters:
+            if MQTTService._matches_topic(f, topic):
+                matches += 1
+    return time.perf_counter() - start, matches
+
+
+def bench_trie(filters, topics):
+    router = TopicRouter()
+    for f in filters:
+        router.add(f, f)
+    matches = 0
+    start = time.perf_counter()
+    for topic in topics:
+        matches += len(router.match(topic))
+    return time.perf_counter() - start, matches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--topics", type=int, default=20000)
+    parser.add_argument("--filters", type=int, nargs="+", default=[2, 10, 50, 200, 1000])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    topics = build_topics(args.topics)
+
+    print(f"{'filters':>8} {'linear us/msg':>14} {'trie us/msg':>12} {'speedup':>8}")
+    for count in args.filters:
+        filters = build_filters(count)
+        linear_s, linear_matches = bench_linear(filters, topics)
+        trie_s, trie_matches = bench_trie(filters, topics)
+        if linear_matches != trie_matches:
+            raise SystemExit(f"match count mismatch: linear={linear_matches} trie={trie_matches}")
+        linear_us = linear_s / len(topics) * 1e6
+        trie_us = trie_s / len(topics) * 1e6
+        print(f"{count:>8} {linear_us:>14.2f} {trie_us:>12.2f} {linear_us / trie_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
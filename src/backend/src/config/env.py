@@ -8,6 +8,8 @@ class MQTTSettings(BaseSettings):
     port: int = 1883
     username: str = ""
     password: str = ""
+    dispatch_workers: int = 4
+    dispatch_queue_size: int = 10000
 
     class Config:
         env_prefix = "MQTT_"
@@ -18,20 +20,92 @@ class InfluxSettings(BaseSettings):
     org: str = "CesIOT"
     bucket: str = "sensors"
     token: str = ""
+    write_batch_size: int = 500
+    write_flush_interval_ms: int = 1000
+    write_queue_size: int = 10000
+    write_block_timeout_ms: int = 0
+    query_concurrency: int = 4
+    query_timeout_ms: int = 30000
 
     class Config:
         env_prefix = "INFLUX_"
 
 
+class QueryCacheSettings(BaseSettings):
+    max_mb: int = 64
+    min_ttl_s: float = 2.0
+    max_ttl_s: float = 300.0
+
+    class Config:
+        env_prefix = "QUERY_CACHE_"
+
+
+class WebSocketSettings(BaseSettings):
+    default_topics: str = "#"
+    queue_size: int = 256
+    overflow_policy: str = "drop_oldest"
+    evict_after_s: float = 30.0
+    batch_interval_ms: int = 0
+
+    class Config:
+        env_prefix = "WS_"
+
+
+class DedupSettings(BaseSettings):
+    window_s: float = 60.0
+    max_entries: int = 200000
+
+    class Config:
+        env_prefix = "DEDUP_"
+
+
+class HealthSettings(BaseSettings):
+    probe_interval_s: float = 5.0
+    probe_timeout_s: float = 3.0
+
+    class Config:
+        env_prefix = "HEALTH_"
+
+
+class RollupSettings(BaseSettings):
+    resolutions: str = "1m,1h"
+    interval_s: float = 60.0
+    lateness_s: float = 120.0
+    backfill: str = "30d"
+
+    class Config:
+        env_prefix = "ROLLUP_"
+
+
+class SpoolSettings(BaseSettings):
+    dir: str = "spool"
+    segment_mb: int = 16
+    max_mb: int = 512
+    fsync_interval_ms: int = 1000
+    replay_batch_size: int = 5000
+    replay_max_points_per_s: int = 20000
+    retry_interval_s: float = 5.0
+
+    class Config:
+        env_prefix = "SPOOL_"
+
+
 class Settings(BaseSettings):
     port: int = 3000
     cors_origin: str = "*"
     debug: bool = False
     env: str = "development"
     mqtt_telemetry_source: str = "telemetry"
+    latest_warm_range: str = "24h"
 
     mqtt: MQTTSettings = MQTTSettings()
     influx: InfluxSettings = InfluxSettings()
+    query_cache: QueryCacheSettings = QueryCacheSettings()
+    ws: WebSocketSettings = WebSocketSettings()
+    dedup: DedupSettings = DedupSettings()
+    health: HealthSettings = HealthSettings()
+    rollup: RollupSettings = RollupSettings()
+    spool: SpoolSettings = SpoolSettings()
 
     class Config:
         env_file = ".env"
@@ -41,5 +115,11 @@ class Settings(BaseSettings):
 # Singleton instance
 settings = Settings(
     mqtt=MQTTSettings(),
-    influx=InfluxSettings()
+    influx=InfluxSettings(),
+    query_cache=QueryCacheSettings(),
+    ws=WebSocketSettings(),
+    dedup=DedupSettings(),
+    health=HealthSettings(),
+    rollup=RollupSettings(),
+    spool=SpoolSettings()
 )
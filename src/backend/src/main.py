@@ -1,14 +1,21 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import json
-from typing import Dict, Any
 
 from config.env import settings
 from services.mqtt_service import mqtt_service
-from services.influx_service import influx_service
+from services.influx_service import influx_service, to_epoch_ms
+from services.latest_store import latest_store
+from services.query_cache import query_cache
+from services.camera_service import camera_service
+from services.health_service import health_service
+from services.rollup_service import rollup_service
+from services.ingestion import ECOGUARD, TELEMETRY, Reading, ingestion
 from routes.sensors import router as sensors_router
 from routes.camera import router as camera_router
+from routes.metrics import router as metrics_router
 from websocket.ws import ws_manager
 
 @asynccontextmanager
@@ -21,106 +28,60 @@ async def lifespan(app: FastAPI):
     influx_service.initialize()
     mqtt_service.connect()
     ws_manager.initialize()
-
-    # Subscribe to telemetry and write to InfluxDB
-    def handle_telemetry(topic: str, payload: Dict[str, Any], raw_message: str):
-        data = payload
-        
-        if not data or not isinstance(data, dict):
-            try:
-                data = json.loads(raw_message)
-            except json.JSONDecodeError as e:
-                if settings.debug:
-                    print(f"MQTT telemetry payload invalid JSON: {topic}, {e}")
-                return
-
-        room = data.get("room")
-        sensor_id = data.get("sensor_id")
-        metric = data.get("metric")
-        value = data.get("value")
-        ts = data.get("ts")
-
-        try:
-            value_number = float(value)
-        except (TypeError, ValueError):
-            if settings.debug:
-                print(f"Invalid value in telemetry: {value}")
-            return
-
-        if not all([room, sensor_id, metric]) or value is None:
-            if settings.debug:
-                print(f"MQTT telemetry payload missing fields: {topic}, {data}")
-            return
-
-        try:
-            influx_service.write_telemetry(
-                room=room,
-                sensor_id=sensor_id,
-                metric=metric,
-                value=value_number,
-                ts=ts
-            )
-            if settings.debug:
-                print(f"Telemetry written to InfluxDB: {topic}, {room}, {sensor_id}, {metric}, {value_number}")
-        except Exception as e:
-            print(f"Failed to write telemetry to InfluxDB: {e}")
-
-    def handle_ecoguard(topic: str, payload: Dict[str, Any], raw_message: str):
-        data = payload
-
-        if not data or not isinstance(data, dict):
-            try:
-                data = json.loads(raw_message)
-            except json.JSONDecodeError as e:
-                if settings.debug:
-                    print(f"MQTT ecoguard payload invalid JSON: {topic}, {e}")
-                return
-
-        room = data.get("room_id") or data.get("room")
-        sensor_id = data.get("device_id") or data.get("sensor_id") or data.get("parent_device_id")
-        metric = data.get("sensor_type") or data.get("metric")
-        value = data.get("value", data.get("amplitude"))
-        ts = data.get("timestamp") or data.get("ts")
-
-        if not all([room, sensor_id, metric]) or value is None:
-            if settings.debug:
-                print(f"MQTT ecoguard payload missing fields: {topic}, {data}")
-            return
-
-        try:
-            value_number = float(value)
-        except (TypeError, ValueError):
-            if settings.debug:
-                print(f"Invalid value in ecoguard payload: {value}")
-            return
-
-        try:
-            influx_service.write_telemetry(
-                room=room,
-                sensor_id=sensor_id,
-                metric=metric,
-                value=value_number,
-                ts=ts
-            )
-            if settings.debug:
-                print(f"Ecoguard telemetry written to InfluxDB: {topic}, {room}, {sensor_id}, {metric}, {value_number}")
-        except Exception as e:
-            print(f"Failed to write ecoguard telemetry to InfluxDB: {e}")
+    health_service.start()
+    rollup_service.start()
+
+    # Store every normalized reading: latest values first, then the InfluxDB write queue
+    def store_reading(reading: Reading):
+        latest_store.update(reading.room, reading.sensor_id, reading.metric, reading.value, to_epoch_ms(reading.ts))
+        queued = influx_service.write_telemetry(
+            room=reading.room,
+            sensor_id=reading.sensor_id,
+            metric=reading.metric,
+            value=reading.value,
+            ts=reading.ts,
+            received_at=reading.received_at
+        )
+        if queued and settings.debug:
+            print(f"Telemetry queued for InfluxDB: {reading}")
+
+    ingestion.add_sink(store_reading)
 
     source = (settings.mqtt_telemetry_source or "telemetry").lower()
     if source in {"telemetry", "both"}:
-        mqtt_service.subscribe("sensors/+/telemetry", handle_telemetry)
+        mqtt_service.subscribe(TELEMETRY.topic, ingestion.handler(TELEMETRY))
     if source in {"ecoguard", "both"}:
-        mqtt_service.subscribe("ecoguard/sensors/+/+", handle_ecoguard)
+        mqtt_service.subscribe(ECOGUARD.topic, ingestion.handler(ECOGUARD))
     
+    # Warm the latest-value store in the background until it succeeds, /latest falls back to Influx meanwhile
+    async def warm_latest_store():
+        delay = 1
+        while not latest_store.warmed:
+            try:
+                latest_store.warm(await influx_service.query_latest(range_time=settings.latest_warm_range))
+                latest_store.warmed = True
+                print("✓ Latest-value store warmed from InfluxDB")
+            except Exception as e:
+                print(f"Failed to warm latest-value store, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+
+    warm_task = asyncio.create_task(warm_latest_store())
+
     print(f"✓ CesIOT API listening on port {settings.port}")
     
     yield
     
     # Shutdown
     print("Shutting down...")
+    warm_task.cancel()
+    health_service.stop()
+    rollup_service.stop()
     mqtt_service.disconnect()
+    ws_manager.close()
+    influx_service.flush()
     influx_service.close()
+    await camera_service.close()
 
 
 app = FastAPI(
@@ -148,9 +109,9 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    mqtt_status = mqtt_service.is_connected()
-    influx_status = await influx_service.health_check()
+    """Health check endpoint, reads the last background probes without any I/O"""
+    mqtt_status = health_service.is_up("mqtt")
+    influx_status = health_service.is_up("influxdb")
     status = "healthy" if (mqtt_status and influx_status) else "degraded"
 
     return {
@@ -158,7 +119,24 @@ async def health_check():
         "services": {
             "mqtt": "up" if mqtt_status else "down",
             "influxdb": "up" if influx_status else "down",
-        }
+        },
+        "checks": health_service.snapshot()
+    }
+
+
+@app.get("/stats")
+async def stats():
+    """Internal pipeline counters"""
+    return {
+        "mqtt_dispatch": mqtt_service.dispatcher.stats(),
+        "ingestion": ingestion.stats(),
+        "dedup": ingestion.dedup.stats() if ingestion.dedup else None,
+        "influx_writer": influx_service.write_stats(),
+        "spool": influx_service.spool_stats(),
+        "query_cache": query_cache.stats(),
+        "rollups": rollup_service.stats(),
+        "websocket": ws_manager.stats(),
+        "camera": camera_service.stats(),
     }
 
 
@@ -173,7 +151,7 @@ async def websocket_endpoint(websocket: WebSocket):
                 message = json.loads(data)
                 await ws_manager.handle_message(websocket, message)
             except json.JSONDecodeError:
-                await websocket.send_json({
+                await ws_manager.send_json(websocket, {
                     "type": "error",
                     "message": "Invalid JSON"
                 })
@@ -184,6 +162,7 @@ async def websocket_endpoint(websocket: WebSocket):
 # Include routers
 app.include_router(sensors_router)
 app.include_router(camera_router)
+app.include_router(metrics_router)
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, WebSocket
 from fastapi.responses import Response, StreamingResponse
 import httpx
 import os
-import time
 import logging
-from threading import Lock
+import time
+from typing import List, Optional, Tuple
+from services.camera_service import CachedFrame, camera_service
+from services.mjpeg_relay import OUTPUT_BOUNDARY, MJPEGRelay, multipart_part
+from websocket.video import VideoSession
 
 router = APIRouter(prefix="/api/camera", tags=["camera"])
 logger = logging.getLogger("camera")
@@ -19,50 +22,86 @@ DEFAULT_STREAM_URL = "http://172.20.10.13/stream"
 STREAM_HUB_BASE = os.environ.get("STREAM_HUB_URL", "http://face-detector:8890")
 AVAILABLE_FILTERS = ["raw", "blur", "none", "quentin", "grayscale", "edges", "nightvision", "thermal", "highcontrast"]
 
-_cache_lock = Lock()
-_last_frame = None
-_last_ts = 0.0
+SNAPSHOT_FRESH_AGE = 0.8
+SNAPSHOT_HEAD_AGE = 2.0
+FIRST_FRAME_TIMEOUT = 10.0
+
+
+def _frame_response(frame: CachedFrame, cache: str, source: str) -> Response:
+    return Response(
+        content=frame.content,
+        media_type=frame.media_type,
+        headers={"X-Cache": cache, "X-Source": source},
+    )
+
+
+def _snapshot_sources(url: Optional[str], filter_name: str) -> List[Tuple[str, str]]:
+    """
+    Snapshot URLs by preference: the hub already decodes the camera stream,
+    so its latest frame costs a memory copy. The ESP32 is only polled as a
+    fallback for the unfiltered image, or when ?url= asks for it directly.
+    """
+    if url:
+        return [(url, "direct")]
+    sources = [(f"{STREAM_HUB_BASE}/snapshot/{filter_name}", "hub")]
+    if filter_name in ("raw", "none"):
+        sources.append((DEFAULT_SNAPSHOT_URL, "camera"))
+    return sources
+
+
+def _relay_frame(filter_name: str, max_age: float) -> Optional[CachedFrame]:
+    """Latest frame of a running stream relay for this filter, if recent enough"""
+    relay = camera_service.active_relay(f"{STREAM_HUB_BASE}/stream/{filter_name}")
+    frame = relay.frame if relay is not None else None
+    if frame is None or time.time() - frame.ts >= max_age:
+        return None
+    return CachedFrame(frame.jpeg, "image/jpeg", frame.ts)
+
+
+def _check_filter(filter_name: str):
+    if filter_name not in AVAILABLE_FILTERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Filtre inconnu: {filter_name}. Disponibles: {AVAILABLE_FILTERS}",
+        )
 
 
 @router.head("/snapshot")
-def snapshot_head():
-    with _cache_lock:
-        if _last_frame is not None and (time.time() - _last_ts) < 2.0:
+async def snapshot_head(filter: str = Query("raw")):
+    _check_filter(filter)
+    if _relay_frame(filter, SNAPSHOT_HEAD_AGE) is not None:
+        return Response(status_code=200, headers={"X-Cache": "hit"})
+    for source_url, _ in _snapshot_sources(None, filter):
+        if camera_service.cached_frame(source_url, max_age=SNAPSHOT_HEAD_AGE) is not None:
             return Response(status_code=200, headers={"X-Cache": "hit"})
     return Response(status_code=204, headers={"X-Cache": "miss"})
 
 
 @router.get("/snapshot")
-async def snapshot(url: str = Query(DEFAULT_SNAPSHOT_URL)):
-    global _last_frame, _last_ts
-
-    logger.info("snapshot requested url=%s", url)
-    with _cache_lock:
-        if _last_frame is not None and (time.time() - _last_ts) < 0.8:
-            return Response(content=_last_frame, media_type="image/jpeg", headers={"X-Cache": "hit"})
-
-    for _ in range(2):
+async def snapshot(url: str = Query(None), filter: str = Query("raw")):
+    logger.info("snapshot requested filter=%s url=%s", filter, url)
+    _check_filter(filter)
+    if not url:
+        frame = _relay_frame(filter, SNAPSHOT_FRESH_AGE)
+        if frame is not None:
+            return _frame_response(frame, "hit", "relay")
+
+    sources = _snapshot_sources(url, filter)
+    for source_url, source in sources:
+        frame = camera_service.cached_frame(source_url, max_age=SNAPSHOT_FRESH_AGE)
+        if frame is not None:
+            return _frame_response(frame, "hit", source)
         try:
-            async with httpx.AsyncClient(timeout=httpx.Timeout(12.0)) as client:
-                resp = await client.get(url)
-                resp.raise_for_status()
-                frame = resp.content
-                content_type = resp.headers.get("content-type", "image/jpeg")
-            if not frame:
-                raise ValueError("Empty snapshot response")
-            with _cache_lock:
-                _last_frame = frame
-                _last_ts = time.time()
-            logger.info("snapshot cache=miss size=%d", len(frame))
-            media_type = content_type if content_type.startswith("image/") else "image/jpeg"
-            return Response(content=frame, media_type=media_type, headers={"X-Cache": "miss"})
-        except (httpx.HTTPError, ValueError) as exc:
-            logger.warning("snapshot upstream error url=%s err=%s", url, repr(exc))
+            frame = await camera_service.fetch_snapshot(source_url)
+            logger.info("snapshot cache=miss source=%s size=%d", source, len(frame.content))
+            return _frame_response(frame, "miss", source)
+        except (httpx.HTTPError, ValueError):
             continue
 
-    with _cache_lock:
-        if _last_frame is not None:
-            return Response(content=_last_frame, media_type="image/jpeg", headers={"X-Cache": "stale"})
+    for source_url, source in sources:
+        frame = camera_service.cached_frame(source_url)
+        if frame is not None:
+            return _frame_response(frame, "stale", source)
 
     raise HTTPException(status_code=502, detail="Camera snapshot failed")
 
@@ -71,69 +110,26 @@ async def snapshot(url: str = Query(DEFAULT_SNAPSHOT_URL)):
 # MJPEG proxy (hub)
 # ---------------------------------------------------------------------------
 
-async def _open_upstream_stream(upstream_url: str, tag: str):
+def _relay_response(relay: MJPEGRelay, tag: str):
     """
-    Open streaming connection to hub.
-    Returns (client, upstream_response, content_type).
-    Caller must close client and response.
+    Relay a hub stream through its shared upstream connection.
+    Every viewer of the same URL reads the same latest-frame slot.
     """
-    logger.warning("[%s] Connecting to: %s", tag, upstream_url)
-    client = httpx.AsyncClient(
-        timeout=None,
-        headers={"Accept": "multipart/x-mixed-replace"},
-    )
-    try:
-        upstream = await client.send(
-            client.build_request("GET", upstream_url),
-            stream=True,
-        )
-        if upstream.status_code != 200:
-            await upstream.aclose()
-            await client.aclose()
-            logger.error("[%s] Upstream returned %s", tag, upstream.status_code)
-            raise HTTPException(status_code=502, detail=f"Upstream returned {upstream.status_code}")
-    except httpx.ConnectError as exc:
-        await client.aclose()
-        logger.error("[%s] Connect error: %s", tag, repr(exc))
-        raise HTTPException(status_code=503, detail=f"Stream hub unreachable: {exc}") from exc
-
-    content_type = upstream.headers.get(
-        "content-type",
-        "multipart/x-mixed-replace; boundary=BoundaryString",
-    )
-    logger.warning("[%s] Connected OK content-type=%s", tag, content_type)
-    return client, upstream, content_type
-
-
-@router.get("/stream")
-async def stream(url: str = Query(None)):
-    """
-    Proxy MJPEG stream via hub (fan-out).
-    If ?url= is provided, bypass for direct test.
-    """
-    upstream_url = url if url else f"{STREAM_HUB_BASE}/stream/raw"
-    logger.warning("[CAM-STREAM] url=%s", upstream_url)
-
-    client, upstream, content_type = await _open_upstream_stream(upstream_url, "CAM-STREAM")
+    upstream_url = relay.url
 
-    async def relay():
+    async def body():
+        logger.warning("[%s] Viewer joined url=%s viewers=%d", tag, upstream_url, relay.viewers + 1)
         try:
-            async for chunk in upstream.aiter_bytes(chunk_size=4096):
-                yield chunk
-        except httpx.ReadTimeout:
-            logger.error("[CAM-STREAM] Read timeout")
-        except Exception as e:
-            logger.error("[CAM-STREAM] Error: %s", e)
+            async for frame in relay.frames():
+                yield multipart_part(frame)
         finally:
-            await upstream.aclose()
-            await client.aclose()
-            logger.warning("[CAM-STREAM] Stream closed")
+            logger.warning("[%s] Viewer left url=%s viewers=%d", tag, upstream_url, relay.viewers)
 
     return StreamingResponse(
-        relay(),
+        body(),
         media_type=None,
         headers={
-            "Content-Type": content_type,
+            "Content-Type": f"multipart/x-mixed-replace; boundary={OUTPUT_BOUNDARY}",
             "Cache-Control": "no-cache, no-store, must-revalidate",
             "Pragma": "no-cache",
             "Expires": "0",
@@ -143,6 +139,26 @@ async def stream(url: str = Query(None)):
     )
 
 
+async def _open_relay(upstream_url: str, tag: str):
+    """Start (or join) the relay and wait for its first frame, 503 if none comes"""
+    relay = camera_service.relay(upstream_url)
+    if await relay.wait_frame(FIRST_FRAME_TIMEOUT) is None:
+        logger.error("[%s] No frame from upstream url=%s", tag, upstream_url)
+        raise HTTPException(status_code=503, detail=f"Stream hub unreachable: {upstream_url}")
+    return _relay_response(relay, tag)
+
+
+@router.get("/stream")
+async def stream(url: str = Query(None)):
+    """
+    Proxy MJPEG stream via hub (fan-out).
+    If ?url= is provided, bypass for direct test.
+    """
+    upstream_url = url if url else f"{STREAM_HUB_BASE}/stream/raw"
+    logger.warning("[CAM-STREAM] url=%s", upstream_url)
+    return await _open_relay(upstream_url, "CAM-STREAM")
+
+
 # ---------------------------------------------------------------------------
 # Face-stream: /api/camera/face-stream/{filter_name}
 # ---------------------------------------------------------------------------
@@ -150,42 +166,28 @@ async def stream(url: str = Query(None)):
 @router.get("/face-stream/{filter_name}")
 async def face_stream(filter_name: str = "blur"):
     """Proxy MJPEG processed stream from hub."""
-    if filter_name not in AVAILABLE_FILTERS:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Filtre inconnu: {filter_name}. Disponibles: {AVAILABLE_FILTERS}",
-        )
+    _check_filter(filter_name)
 
     upstream_url = f"{STREAM_HUB_BASE}/stream/{filter_name}"
     logger.warning("[CAM-FACE] filter=%s url=%s", filter_name, upstream_url)
+    return await _open_relay(upstream_url, "CAM-FACE")
 
-    client, upstream, content_type = await _open_upstream_stream(upstream_url, "CAM-FACE")
 
-    async def relay():
-        try:
-            async for chunk in upstream.aiter_bytes(chunk_size=4096):
-                yield chunk
-        except httpx.ReadTimeout:
-            logger.error("[CAM-FACE] Read timeout filter=%s", filter_name)
-        except Exception as e:
-            logger.error("[CAM-FACE] Error: %s", e)
-        finally:
-            await upstream.aclose()
-            await client.aclose()
-            logger.warning("[CAM-FACE] Stream closed filter=%s", filter_name)
+# ---------------------------------------------------------------------------
+# Binary video channel: /api/camera/ws/{filter_name}
+# ---------------------------------------------------------------------------
 
-    return StreamingResponse(
-        relay(),
-        media_type=None,
-        headers={
-            "Content-Type": content_type,
-            "Cache-Control": "no-cache, no-store, must-revalidate",
-            "Pragma": "no-cache",
-            "Expires": "0",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-        },
-    )
+@router.websocket("/ws/{filter_name}")
+async def video_socket(websocket: WebSocket, filter_name: str, credits: int = Query(2)):
+    """One binary message per JPEG frame with face metadata, credit-based flow control."""
+    if filter_name not in AVAILABLE_FILTERS:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    upstream_url = f"{STREAM_HUB_BASE}/stream/{filter_name}"
+    logger.warning("[CAM-WS] filter=%s url=%s credits=%d", filter_name, upstream_url, credits)
+    await VideoSession(websocket, camera_service.relay(upstream_url), credits).run()
+    logger.warning("[CAM-WS] Closed filter=%s", filter_name)
 
 
 @router.get("/filters")
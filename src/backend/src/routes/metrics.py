@@ -0,0 +1,141 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from services.camera_service import camera_service
+from services.influx_service import influx_service
+from services.ingestion import ingestion
+from services.metrics import registry, value
+from services.mqtt_service import mqtt_service
+from services.query_cache import query_cache
+from services.rollup_service import rollup_service
+from websocket.connection import ClientConnection
+from websocket.ws import ws_manager
+
+router = APIRouter(tags=["metrics"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _per_source(key: str):
+    return [({"source": source}, counters[key]) for source, counters in ingestion.stats().items()]
+
+
+def _spool(key: str):
+    stats = influx_service.spool_stats()
+    return value(stats[key] if stats else None)
+
+
+def _relays(key: str):
+    return [({"url": relay["url"]}, relay[key]) for relay in camera_service.stats()["relays"]]
+
+
+# Read from the services' own counters at scrape time
+registry.counter_func(
+    "cesiot_ingested_total", "Telemetry readings accepted by the ingestion pipeline",
+    lambda: _per_source("ingested")
+)
+registry.counter_func(
+    "cesiot_ingest_rejected_total", "Telemetry payloads rejected by their normalizer",
+    lambda: _per_source("rejected")
+)
+registry.counter_func(
+    "cesiot_dedup_duplicates_total", "Telemetry readings dropped as duplicates",
+    lambda: value(ingestion.dedup.stats()["duplicates"] if ingestion.dedup else None)
+)
+registry.gauge_func(
+    "cesiot_mqtt_connected", "1 when the MQTT client is connected",
+    lambda: value(1 if mqtt_service.is_connected() else 0)
+)
+registry.gauge_func(
+    "cesiot_mqtt_dispatch_queue_depth", "MQTT messages waiting for a dispatch worker",
+    lambda: value(mqtt_service.dispatcher.stats()["pending"])
+)
+registry.counter_func(
+    "cesiot_mqtt_dispatch_dropped_total", "MQTT messages dropped because the dispatch queue was full",
+    lambda: value(mqtt_service.dispatcher.stats()["dropped"])
+)
+registry.gauge_func(
+    "cesiot_influx_write_queue_depth", "Readings waiting for the InfluxDB writer",
+    lambda: value(influx_service.write_stats()["pending"])
+)
+registry.counter_func(
+    "cesiot_influx_points_written_total", "Points written to InfluxDB",
+    lambda: value(influx_service.write_stats()["written"])
+)
+registry.counter_func(
+    "cesiot_influx_points_failed_total", "Points lost to failed InfluxDB writes",
+    lambda: value(influx_service.write_stats()["failed"])
+)
+registry.counter_func(
+    "cesiot_influx_points_dropped_total", "Readings dropped because the InfluxDB write queue was full",
+    lambda: value(influx_service.write_stats()["dropped"])
+)
+registry.counter_func(
+    "cesiot_influx_points_spooled_total", "Points written to the disk spool while InfluxDB was failing",
+    lambda: value(influx_service.write_stats()["spooled"])
+)
+registry.gauge_func(
+    "cesiot_spool_pending_points", "Spooled points waiting to be replayed into InfluxDB",
+    lambda: _spool("pending")
+)
+registry.gauge_func(
+    "cesiot_spool_bytes", "Disk used by spooled points not replayed yet",
+    lambda: _spool("bytes")
+)
+registry.counter_func(
+    "cesiot_spool_replayed_total", "Spooled points replayed since startup",
+    lambda: _spool("replayed")
+)
+registry.counter_func(
+    "cesiot_spool_dropped_total", "Spooled points dropped by the spool size cap",
+    lambda: _spool("dropped")
+)
+registry.counter_func(
+    "cesiot_query_cache_hits_total", "History queries answered from the cache",
+    lambda: value(query_cache.stats()["hits"])
+)
+registry.counter_func(
+    "cesiot_query_cache_misses_total", "History queries sent to InfluxDB",
+    lambda: value(query_cache.stats()["misses"])
+)
+registry.gauge_func(
+    "cesiot_rollup_lag_seconds", "Age of the newest window aggregated into each rollup bucket",
+    lambda: [({"bucket": rollup["bucket"]}, rollup["lag_s"]) for rollup in rollup_service.stats() if rollup["lag_s"] is not None]
+)
+registry.gauge_func(
+    "cesiot_ws_clients", "Connected /ws clients",
+    lambda: value(len(ws_manager.clients))
+)
+registry.gauge_func(
+    "cesiot_ws_pending_frames", "Frames queued for /ws clients",
+    lambda: value(ws_manager.stats()["pending"])
+)
+registry.counter_func(
+    "cesiot_ws_dropped_frames_total", "Frames dropped from the full queues of /ws clients",
+    lambda: value(ClientConnection.dropped_total)
+)
+registry.counter_func(
+    "cesiot_ws_evicted_total", "Slow /ws clients disconnected",
+    lambda: value(ws_manager.evicted)
+)
+registry.gauge_func(
+    "cesiot_camera_relays", "Active upstream MJPEG relays",
+    lambda: value(len(camera_service.stats()["relays"]))
+)
+registry.gauge_func(
+    "cesiot_camera_relay_viewers", "Viewers of each MJPEG relay",
+    lambda: _relays("viewers")
+)
+registry.gauge_func(
+    "cesiot_camera_relay_bytes_per_second", "Upstream throughput of each MJPEG relay",
+    lambda: _relays("bytes_per_s")
+)
+registry.counter_func(
+    "cesiot_camera_relay_bytes_total", "Bytes received by each MJPEG relay",
+    lambda: _relays("bytes_in")
+)
+
+
+@router.get("/metrics")
+async def metrics():
+    """Prometheus metrics, rendered on the event loop like the state they read"""
+    return Response(content=registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
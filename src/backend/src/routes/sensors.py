@@ -1,11 +1,29 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any, List
-from services.influx_service import influx_service
+from typing import Optional, Dict, Any, List, Awaitable, AsyncIterator, Tuple
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import asyncio
+import csv
+import io
+import json
+import time
+from services.influx_service import influx_service, STREAM_COLUMNS
+from services.downsampling import AGGREGATE_FUNCTIONS, is_duration, parse_duration
+from services.latest_store import latest_store
+from services.query_cache import query_cache
 from services.mqtt_service import mqtt_service
+from config.env import settings
 
 router = APIRouter(prefix="/api/sensors", tags=["sensors"])
 
+# How often a pending query checks whether its HTTP client is still there
+DISCONNECT_POLL_INTERVAL = 0.25
+
+# ETag prefix, so versions counted by a previous run of the API never match
+_INSTANCE = f"{int(time.time() * 1000):x}"
+
 class ActionRequest(BaseModel):
     target: str
     payload: Optional[Dict[str, Any]] = None
@@ -27,62 +45,326 @@ class ErrorResponse(BaseModel):
     error: str
 
 
+async def _cancel_on_disconnect(request: Request, query: Awaitable[Any]) -> Any:
+    """Await an Influx query, cancelling it if the HTTP client disconnects (None is returned then)"""
+    task = asyncio.ensure_future(query)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                # Nobody is left to read the response
+                return None
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def _parse_since(since: Optional[str]) -> Optional[datetime]:
+    """`since` cursor, as epoch ms (like columnar `t` values) or an ISO 8601 time"""
+    if not since:
+        return None
+    try:
+        if since.isdigit():
+            return datetime.fromtimestamp(int(since) / 1000, tz=timezone.utc)
+        parsed = datetime.fromisoformat(since.replace("Z", "+00:00"))
+    except (ValueError, OverflowError, OSError):
+        raise HTTPException(status_code=400, detail=f"Invalid since: {since}")
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _validators(version: Tuple[int, Optional[datetime]]) -> Dict[str, str]:
+    """ETag and Last-Modified headers of a data version"""
+    count, modified_at = version
+    headers = {"ETag": f'"{_INSTANCE}-{count}"', "Cache-Control": "no-cache"}
+    if modified_at is not None:
+        headers["Last-Modified"] = format_datetime(modified_at, usegmt=True)
+    return headers
+
+
+# Empty answer after an InfluxDB failure, not a representation of any data version
+_FAILED_HEADERS = {"Cache-Control": "no-store"}
+
+
+def _not_modified(request: Request, version: Tuple[int, Optional[datetime]]) -> Optional[Response]:
+    """304 response when the client's validators still match the data version"""
+    headers = _validators(version)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        matched = "*" in tags or headers["ETag"] in tags
+    else:
+        matched = _unmodified_since(request.headers.get("if-modified-since"), version[1])
+    return Response(status_code=304, headers=headers) if matched else None
+
+
+def _unmodified_since(if_modified_since: Optional[str], modified_at: Optional[datetime]) -> bool:
+    if not if_modified_since or modified_at is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates have whole-second precision
+    return since.tzinfo is not None and modified_at.replace(microsecond=0) <= since
+
+
+def _format_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _to_ndjson(rows: List[Tuple[Any, ...]]) -> bytes:
+    lines = [
+        json.dumps(dict(zip(STREAM_COLUMNS, map(_format_value, row))), separators=(",", ":"))
+        for row in rows
+    ]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _to_csv(rows: List[Tuple[Any, ...]]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(
+        [_format_value(value) for value in row] for row in rows
+    )
+    return buffer.getvalue().encode()
+
+
+def _normalize_list(value: Optional[str]) -> Optional[str]:
+    """Comma-separated filter values, deduplicated and sorted so equal filters share a cache entry"""
+    if not value:
+        return None
+    values = sorted({item.strip() for item in value.split(",") if item.strip()})
+    return ",".join(values) or None
+
+
+def _validate_range(range_time: str):
+    """range is spliced into the Flux query, only duration literals are accepted"""
+    if not is_duration(range_time):
+        raise HTTPException(status_code=400, detail=f"Invalid range: {range_time}")
+
+
+def _validate_downsampling(range_time: str, every: Optional[str], max_points: Optional[int], fn: str):
+    _validate_range(range_time)
+    if every and not is_duration(every):
+        raise HTTPException(status_code=400, detail=f"Invalid every: {every}")
+    if fn not in AGGREGATE_FUNCTIONS:
+        raise HTTPException(status_code=400, detail=f"Invalid fn: {fn}. Available: {AGGREGATE_FUNCTIONS}")
+
+
+async def _stream_history(
+    sensor: Optional[str],
+    room: Optional[str],
+    metric: Optional[str],
+    range_time: str,
+    every: Optional[str],
+    fn: str,
+    max_points: Optional[int],
+    since: Optional[datetime],
+    format: str,
+    headers: Dict[str, str]
+) -> StreamingResponse:
+    """Stream history as NDJSON or CSV, one Influx chunk at a time"""
+    chunks = influx_service.stream_history(
+        sensor=sensor,
+        room=room,
+        metric=metric,
+        range_time=range_time,
+        every=every,
+        fn=fn,
+        max_points=max_points,
+        since=since
+    )
+    # Pull the first chunk here so query errors still map to an HTTP status
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = []
+    except Exception:
+        await chunks.aclose()
+        raise HTTPException(status_code=502, detail="InfluxDB query failed")
+
+    encode = _to_csv if format == "csv" else _to_ndjson
+
+    async def body() -> AsyncIterator[bytes]:
+        try:
+            if format == "csv":
+                yield (",".join(STREAM_COLUMNS) + "\n").encode()
+            if first:
+                yield encode(first)
+            async for rows in chunks:
+                yield encode(rows)
+        finally:
+            await chunks.aclose()
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type, headers=headers)
+
+
 @router.get("/history", response_model=HistoryResponse)
 async def get_history(
+    request: Request,
+    response: Response,
     sensor: Optional[str] = Query(None),
     room: Optional[str] = Query(None),
     metric: Optional[str] = Query(None),
-    range: str = Query("24h", alias="range")
+    range: str = Query("24h", alias="range"),
+    every: Optional[str] = Query(None),
+    max_points: Optional[int] = Query(None, ge=3),
+    fn: str = Query("mean"),
+    downsample: str = Query("window", pattern="^(window|lttb)$"),
+    format: str = Query("json", pattern="^(json|ndjson|csv|columnar)$"),
+    since: Optional[str] = Query(None)
 ):
     """
     Get historical sensor data from InfluxDB
     
-    - **sensor**: Filter by sensor name (optional)
-    - **room**: Filter by room name (optional)
-    - **metric**: Filter by metric tag (optional)
+    - **sensor**: Filter by sensor name, comma-separated for several (optional)
+    - **room**: Filter by room name, comma-separated for several (optional)
+    - **metric**: Filter by metric tag, comma-separated for several (optional)
     - **range**: Time range (e.g., 24h, 7d, 1w) (default: 24h)
+    - **every**: Aggregation window (e.g., 5m, 1h) (optional)
+    - **max_points**: Point budget per series, derives the window when every is not set (optional)
+    - **fn**: Window aggregate: mean, min, max or last (default: mean)
+    - **downsample**: window (default) or lttb to keep max_points raw points per series (json and columnar only)
+    - **format**: json (default), columnar for one entry per series with its tags and parallel
+      `t` (epoch ms) / `v` arrays, or ndjson / csv to stream time, room, sensor_id, metric, value
+    - **since**: Only points strictly newer than this cursor, epoch ms or ISO 8601 (optional)
+
+    Responses carry an ETag / Last-Modified bumped by each InfluxDB write,
+    a matching If-None-Match or If-Modified-Since gets a 304 without querying.
     """
-    try:
-        data = await influx_service.query_history(
-            sensor=sensor,
-            room=room,
-            metric=metric,
-            range_time=range
+    _validate_downsampling(range, every, max_points, fn)
+    sensor, room, metric = _normalize_list(sensor), _normalize_list(room), _normalize_list(metric)
+    since_time = _parse_since(since)
+
+    version = influx_service.data_version()
+    not_modified = _not_modified(request, version)
+    if not_modified is not None:
+        return not_modified
+
+    if format in ("ndjson", "csv"):
+        if downsample == "lttb":
+            raise HTTPException(status_code=400, detail="downsample=lttb is only available with format=json or columnar")
+        return await _stream_history(
+            sensor, room, metric, range, every, fn, max_points, since_time, format, _validators(version)
         )
-        return HistoryResponse(
-            success=True,
-            count=len(data),
-            data=data
+
+    columnar = format == "columnar"
+    query = influx_service.query_history_columnar if columnar else influx_service.query_history
+    try:
+        aggregated = bool(every or max_points)
+        cache_key = (
+            "history",
+            format,
+            sensor,
+            room,
+            metric,
+            range.strip().lower(),
+            every,
+            fn if aggregated else None,
+            max_points,
+            downsample if max_points else None,
+            since_time,
         )
+        loaded = await _cancel_on_disconnect(request, query_cache.get_or_load(
+            cache_key,
+            query_cache.ttl_for(range),
+            lambda: query(
+                sensor=sensor,
+                room=room,
+                metric=metric,
+                range_time=range,
+                every=every,
+                fn=fn,
+                max_points=max_points,
+                since=since_time,
+                downsample=downsample
+            ),
+            version
+        ))
+        data, version = loaded or ([], version)
+        headers = _validators(version)
     except Exception:
-        return HistoryResponse(
-            success=True,
-            count=0,
-            data=[]
-        )
+        data, headers = [], _FAILED_HEADERS
+
+    if columnar:
+        # Plain lists of numbers, encoded directly instead of through the response model
+        return JSONResponse({
+            "success": True,
+            "count": sum(len(series["t"]) for series in data),
+            "series": data
+        }, headers=headers)
+    response.headers.update(headers)
+    return HistoryResponse(
+        success=True,
+        count=len(data),
+        data=data
+    )
 
 
 @router.get("/latest", response_model=HistoryResponse)
 async def get_latest(
+    request: Request,
+    response: Response,
     room: Optional[str] = Query(None),
     sensor_id: Optional[str] = Query(None),
-    range: str = Query("1h", alias="range")
+    range: str = Query("1h", alias="range"),
+    since: Optional[str] = Query(None)
 ):
     """
-    Get latest telemetry per metric from InfluxDB
+    Get latest telemetry per metric, from the in-memory store when it has the series
+    and the range fits in the warmed one, from InfluxDB otherwise.
+    `since` (epoch ms or ISO 8601) keeps only series updated after it. Responses carry an
+    ETag / Last-Modified bumped by ingestion, a matching conditional request gets a 304.
     """
+    _validate_range(range)
+    since_time = _parse_since(since)
+    version = latest_store.data_version()
+    not_modified = _not_modified(request, version)
+    if not_modified is not None:
+        return not_modified
+
+    in_store = parse_duration(range) <= parse_duration(settings.latest_warm_range)
+    if latest_store.warmed and in_store:
+        newer_than = datetime.now(timezone.utc) - timedelta(seconds=parse_duration(range))
+        data = latest_store.query(room=room, sensor_id=sensor_id, newer_than=newer_than)
+        if data:
+            if since_time is not None:
+                data = [row for row in data if row["time"] > since_time]
+            response.headers.update(_validators(version))
+            response.headers["X-Cache"] = "hit"
+            return HistoryResponse(
+                success=True,
+                count=len(data),
+                data=data
+            )
+
+    response.headers["X-Cache"] = "miss"
     try:
-        data = await influx_service.query_latest(
+        data = await _cancel_on_disconnect(request, influx_service.query_latest(
             room=room,
             sensor_id=sensor_id,
-            range_time=range
-        )
+            range_time=range,
+            since=since_time
+        ))
+        if data is None:
+            data = []
+        else:
+            latest_store.warm(data)
+            # Every series of the warm range was just loaded, the store can serve them from now on
+            full = not (room or sensor_id or since_time)
+            if full and parse_duration(range) >= parse_duration(settings.latest_warm_range):
+                latest_store.warmed = True
+        response.headers.update(_validators(version))
         return HistoryResponse(
             success=True,
             count=len(data),
             data=data
         )
     except Exception:
+        response.headers.update(_FAILED_HEADERS)
         return HistoryResponse(
             success=True,
             count=0,
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import httpx
+
+from services.mjpeg_relay import MJPEGRelay
+
+logger = logging.getLogger("camera")
+
+SNAPSHOT_CACHE_BYTES = int(os.environ.get("CAMERA_SNAPSHOT_CACHE_BYTES", str(8 * 1024 * 1024)))
+SNAPSHOT_TIMEOUT = float(os.environ.get("CAMERA_SNAPSHOT_TIMEOUT", "12"))
+SNAPSHOT_ATTEMPTS = 2
+RELAY_IDLE_TIMEOUT = float(os.environ.get("CAMERA_RELAY_IDLE_TIMEOUT", "5"))
+
+
+class CachedFrame:
+    __slots__ = ("content", "media_type", "ts")
+
+    def __init__(self, content: bytes, media_type: str, ts: float):
+        self.content = content
+        self.media_type = media_type
+        self.ts = ts
+
+
+class CameraService:
+    """
+    Shared upstream access for camera routes: one pooled HTTP client,
+    at most one in-flight snapshot fetch per URL, a per-URL frame cache
+    bounded in bytes and one MJPEG relay per stream URL.
+    Must only be used from the event loop thread.
+    """
+
+    def __init__(self, cache_bytes: int = SNAPSHOT_CACHE_BYTES):
+        self.cache_bytes = cache_bytes
+        self._client: Optional[httpx.AsyncClient] = None
+        self._frames: "OrderedDict[str, CachedFrame]" = OrderedDict()
+        self._frames_bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._relays: Dict[str, MJPEGRelay] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Pooled client, connections are kept alive across requests"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(SNAPSHOT_TIMEOUT),
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=8),
+            )
+        return self._client
+
+    def cached_frame(self, url: str, max_age: Optional[float] = None) -> Optional[CachedFrame]:
+        """Last frame fetched from a URL, if younger than max_age seconds"""
+        frame = self._frames.get(url)
+        if frame is None:
+            return None
+        if max_age is not None and (time.time() - frame.ts) >= max_age:
+            return None
+        self._frames.move_to_end(url)
+        return frame
+
+    async def fetch_snapshot(self, url: str) -> CachedFrame:
+        """Fetch a fresh frame, joining the fetch already running for the same URL"""
+        fetch = self._inflight.get(url)
+        if fetch is None:
+            fetch = asyncio.ensure_future(self._fetch(url))
+            self._inflight[url] = fetch
+            fetch.add_done_callback(lambda task: self._on_fetched(url, task))
+        else:
+            logger.info("snapshot coalesced url=%s", url)
+        # Shielded: a caller going away must not abort the fetch others wait on
+        return await asyncio.shield(fetch)
+
+    def _on_fetched(self, url: str, task: asyncio.Future):
+        self._inflight.pop(url, None)
+        # Retrieve the error even if every waiter is gone
+        if not task.cancelled():
+            task.exception()
+
+    def relay(self, url: str) -> MJPEGRelay:
+        """Shared relay of an MJPEG stream, created on first use"""
+        relay = self._relays.get(url)
+        if relay is None:
+            relay = MJPEGRelay(url, self.client, RELAY_IDLE_TIMEOUT, self._on_relay_stopped)
+            self._relays[url] = relay
+        return relay
+
+    def active_relay(self, url: str) -> Optional[MJPEGRelay]:
+        return self._relays.get(url)
+
+    def _on_relay_stopped(self, relay: MJPEGRelay):
+        if self._relays.get(relay.url) is relay:
+            del self._relays[relay.url]
+
+    async def close(self):
+        for relay in list(self._relays.values()):
+            relay.stop()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _fetch(self, url: str) -> CachedFrame:
+        last_error: Optional[Exception] = None
+        for _ in range(SNAPSHOT_ATTEMPTS):
+            try:
+                resp = await self.client.get(url)
+                resp.raise_for_status()
+                content = resp.content
+                if not content:
+                    raise ValueError("Empty snapshot response")
+                content_type = resp.headers.get("content-type", "image/jpeg")
+                media_type = content_type if content_type.startswith("image/") else "image/jpeg"
+                frame = CachedFrame(content, media_type, time.time())
+                self._store(url, frame)
+                return frame
+            except (httpx.HTTPError, ValueError) as exc:
+                logger.warning("snapshot upstream error url=%s err=%s", url, repr(exc))
+                last_error = exc
+        raise last_error
+
+    def _store(self, url: str, frame: CachedFrame):
+        previous = self._frames.pop(url, None)
+        if previous is not None:
+            self._frames_bytes -= len(previous.content)
+        if len(frame.content) > self.cache_bytes:
+            return
+        self._frames[url] = frame
+        self._frames_bytes += len(frame.content)
+        while self._frames_bytes > self.cache_bytes:
+            _, evicted = self._frames.popitem(last=False)
+            self._frames_bytes -= len(evicted.content)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cached_urls": len(self._frames),
+            "cached_bytes": self._frames_bytes,
+            "inflight": len(self._inflight),
+            "relays": [relay.snapshot() for relay in self._relays.values()],
+        }
+
+
+# Singleton instance
+camera_service = CameraService()
@@ -0,0 +1,54 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable
+
+
+class DedupWindow:
+    """
+    Set of recently seen keys, forgotten window seconds after first sight.
+    Keys are stored as their hash in insertion order, which is also expiry
+    order, so eviction only ever looks at the oldest entries.
+    Thread-safe, shared by the MQTT dispatcher workers.
+    """
+
+    def __init__(self, window: float, max_entries: int):
+        self.window = window
+        self.max_entries = max(1, max_entries)
+        self._seen: "OrderedDict[int, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "checked": 0,
+            "duplicates": 0,
+            "expired": 0,
+            "overflowed": 0,
+        }
+
+    def add(self, key: Hashable) -> bool:
+        """Record a key, False if it was already seen within the window"""
+        digest = hash(key)
+        now = time.monotonic()
+        with self._lock:
+            self._stats["checked"] += 1
+            self._evict(now)
+            if digest in self._seen:
+                self._stats["duplicates"] += 1
+                return False
+            if len(self._seen) >= self.max_entries:
+                self._seen.popitem(last=False)
+                self._stats["overflowed"] += 1
+            self._seen[digest] = now + self.window
+            return True
+
+    def _evict(self, now: float):
+        seen = self._seen
+        while seen:
+            oldest = next(iter(seen))
+            if seen[oldest] > now:
+                return
+            seen.popitem(last=False)
+            self._stats["expired"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "size": len(self._seen)}
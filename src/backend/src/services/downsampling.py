@@ -0,0 +1,134 @@
+import math
+import re
+from datetime import datetime
+from operator import itemgetter
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+AGGREGATE_FUNCTIONS = ["mean", "min", "max", "last"]
+
+DURATION_PATTERN = re.compile(r"^(\d+(ns|us|ms|s|mo|m|h|d|w|y))+$")
+_DURATION_PART = re.compile(r"(\d+)(ns|us|ms|s|mo|m|h|d|w|y)")
+_UNIT_SECONDS = {
+    "ns": 1e-9,
+    "us": 1e-6,
+    "ms": 1e-3,
+    "s": 1,
+    "m": 60,
+    "h": 3600,
+    "d": 86400,
+    "w": 7 * 86400,
+    "mo": 30 * 86400,
+    "y": 365 * 86400,
+}
+
+
+def is_duration(value: str) -> bool:
+    """Check a Flux duration literal such as 5m, 1h30m or 7d"""
+    return bool(DURATION_PATTERN.fullmatch(value or ""))
+
+
+def parse_duration(value: str) -> float:
+    """Convert a Flux duration literal to seconds (months are 30 days)"""
+    if not is_duration(value):
+        raise ValueError(f"Invalid duration: {value}")
+    return sum(int(amount) * _UNIT_SECONDS[unit] for amount, unit in _DURATION_PART.findall(value))
+
+
+def window_for(range_time: str, max_points: int) -> str:
+    """
+    Smallest whole-second aggregation window keeping a series within max_points.
+    Windows are aligned to the epoch while the range start is not, so the range may
+    touch one window more than it spans: the window is sized for max_points - 1.
+    """
+    seconds = parse_duration(range_time)
+    return f"{max(1, math.ceil(seconds / max(1, max_points - 1)))}s"
+
+
+def lttb(points: Sequence[Any], threshold: int, x: Callable[[Any], float], y: Callable[[Any], float]) -> List[Any]:
+    """
+    Largest-Triangle-Three-Buckets reduction of an ordered series.
+    Keeps first and last points and the most significant point of each bucket.
+    """
+    length = len(points)
+    if threshold >= length or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (length - 2) / (threshold - 2)
+    selected = 0
+
+    for bucket in range(threshold - 2):
+        # Average of the next bucket, used as the third triangle vertex
+        next_start = int((bucket + 1) * bucket_size) + 1
+        next_end = min(int((bucket + 2) * bucket_size) + 1, length)
+        next_points = points[next_start:next_end]
+        avg_x = sum(x(p) for p in next_points) / len(next_points)
+        avg_y = sum(y(p) for p in next_points) / len(next_points)
+
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        ax, ay = x(points[selected]), y(points[selected])
+
+        best_area = -1.0
+        best_index = start
+        for index in range(start, end):
+            area = abs((ax - avg_x) * (y(points[index]) - ay) - (ax - x(points[index])) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best_index = index
+
+        sampled.append(points[best_index])
+        selected = best_index
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def lttb_rows(rows: List[Dict[str, Any]], max_points: int) -> List[Dict[str, Any]]:
+    """Apply LTTB to each series (room, sensor_id, metric, field) of history rows"""
+    series: Dict[tuple, List[Dict[str, Any]]] = {}
+    for row in rows:
+        if not isinstance(row.get("value"), (int, float)) or row.get("time") is None:
+            continue
+        key = (row.get("room"), row.get("sensor_id"), row.get("metric"), row.get("field"))
+        series.setdefault(key, []).append(row)
+
+    reduced: List[Dict[str, Any]] = []
+    for points in series.values():
+        points.sort(key=lambda row: row["time"])
+        reduced.extend(lttb(
+            points,
+            max_points,
+            x=lambda row: row["time"].timestamp(),
+            y=lambda row: float(row["value"])
+        ))
+    return reduced
+
+
+def lttb_series(series: Dict[str, Any], max_points: int) -> Dict[str, Any]:
+    """Apply LTTB to one columnar series, keeping its tags and parallel t/v arrays"""
+    if len(series["t"]) <= max_points:
+        return series
+    points = lttb(list(zip(series["t"], series["v"])), max_points, x=itemgetter(0), y=itemgetter(1))
+    return {**series, "t": [t for t, _ in points], "v": [v for _, v in points]}
+
+
+class Rollup:
+    """
+    Downsampled copy of the raw bucket: one point per `every` window and series,
+    stamped at the window start, with one field per AGGREGATE_FUNCTIONS entry.
+    """
+
+    def __init__(self, every: str, bucket: str):
+        self.every = every
+        self.seconds = int(parse_duration(every))
+        self.bucket = bucket
+        # Span aggregated so far, unknown until read back from the bucket
+        self.covers_from: Optional[datetime] = None
+        self.done_until: Optional[datetime] = None
+        # Set once caught up, queries only read it from then on
+        self.ready = False
+
+    def covers(self, start: datetime) -> bool:
+        """Whether a query starting at `start` can read its older part from this rollup"""
+        return self.ready and self.covers_from <= start < self.done_until
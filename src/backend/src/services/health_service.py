@@ -0,0 +1,87 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from config.env import settings
+from services.influx_service import influx_service
+from services.mqtt_service import mqtt_service
+
+
+class ProbeResult:
+    __slots__ = ("up", "checked_at", "latency_ms", "checked_monotonic")
+
+    def __init__(self, up: bool, latency_ms: float):
+        self.up = up
+        self.latency_ms = latency_ms
+        self.checked_at = datetime.now().isoformat()
+        self.checked_monotonic = time.monotonic()
+
+
+class HealthService:
+    """
+    Dependency status refreshed by a background task, so /health only reads memory.
+    A result older than three probe intervals (plus the probe timeout) counts as down,
+    the prober itself is stuck.
+    Must only be used from the event loop thread.
+    """
+
+    def __init__(self, interval: float, timeout: float):
+        self.interval = interval
+        self.timeout = timeout
+        self._results: Dict[str, ProbeResult] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.probe()
+            except Exception as e:
+                print(f"Health probe error: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def probe(self):
+        """Refresh every dependency status once"""
+        self._results["mqtt"] = ProbeResult(mqtt_service.is_connected(), 0.0)
+
+        started = time.monotonic()
+        up = await influx_service.ping(self.timeout)
+        previous = self._results.get("influxdb")
+        self._results["influxdb"] = ProbeResult(up, round((time.monotonic() - started) * 1000, 1))
+        if previous is None or previous.up != up:
+            print("✓ InfluxDB health probe up" if up else "InfluxDB health probe failed")
+
+    def is_up(self, name: str) -> bool:
+        result = self._results.get(name)
+        return result is not None and result.up and not self._is_stale(result)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Last probe of each dependency, with when it ran"""
+        return {
+            name: {
+                "status": "up" if self.is_up(name) else "down",
+                "checked_at": result.checked_at,
+                "latency_ms": result.latency_ms,
+                "stale": self._is_stale(result),
+            }
+            for name, result in self._results.items()
+        }
+
+    def _is_stale(self, result: ProbeResult) -> bool:
+        return time.monotonic() - result.checked_monotonic > 3 * self.interval + self.timeout
+
+
+# Singleton instance
+health_service = HealthService(
+    interval=settings.health.probe_interval_s,
+    timeout=settings.health.probe_timeout_s
+)
@@ -1,9 +1,74 @@
 from influxdb_client import InfluxDBClient, Point, WritePrecision
 from influxdb_client.client.write_api import SYNCHRONOUS
-from typing import List, Dict, Optional, Any
+from influxdb_client.client.flux_table import FluxRecord
+from influxdb_client.rest import ApiException
+from typing import List, Dict, Optional, Any, AsyncIterator, Callable, Iterable, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, takewhile
 import asyncio
-from datetime import datetime
+import json
+import math
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 from config.env import settings
+from services.downsampling import AGGREGATE_FUNCTIONS, Rollup, is_duration, lttb_rows, lttb_series, parse_duration, window_for
+from services.latest_store import latest_row
+from services.metrics import INFLUX_QUERY_DURATION, INFLUX_WRITE_DURATION, INGEST_TO_STORAGE
+from services.spool import Spool
+
+# Sentinel pushed on the write queue to stop the writer thread
+_STOP = object()
+
+# Columns sent by streaming history responses, and their Flux names
+STREAM_COLUMNS = ["time", "room", "sensor_id", "metric", "value"]
+STREAM_FLUX_COLUMNS = ["_time", "room", "sensor_id", "metric", "_value"]
+
+# Tags sent once per series by columnar history responses, and their Flux names
+SERIES_COLUMNS = ["measurement", "field", "room", "sensor_id", "metric"]
+SERIES_FLUX_COLUMNS = ["_measurement", "_field", "room", "sensor_id", "metric"]
+
+# Write errors caused by the points themselves, retrying them can never succeed
+REJECTED_WRITE_STATUSES = {400, 422}
+
+# Measurement holding how far a rollup bucket has been aggregated
+ROLLUP_STATE_MEASUREMENT = "rollup_state"
+
+
+def flux_string(value: str) -> str:
+    """Quoted Flux string literal, escaping quotes, backslashes and ${ interpolation"""
+    return json.dumps(value, ensure_ascii=False).replace("${", "\\${")
+
+
+def to_epoch_ms(ts: Optional[Any]) -> int:
+    """Normalize a telemetry timestamp (s or ms) to epoch ms, defaulting to now"""
+    timestamp = int(datetime.now().timestamp() * 1000)
+    if ts and isinstance(ts, (int, float)):
+        ts_int = int(ts)
+        if ts_int >= 1_000_000_000_000:
+            timestamp = ts_int
+        elif ts_int >= 1_600_000_000:
+            timestamp = ts_int * 1000
+    return timestamp
+
+
+def columnar_series(records: Iterable[FluxRecord]) -> List[Dict[str, Any]]:
+    """Group records by series: tags once, then parallel epoch ms `t` and float `v` arrays"""
+    series: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    for record in records:
+        values = record.values
+        value = values.get("_value")
+        ts = values.get("_time")
+        if not isinstance(value, (int, float)) or ts is None:
+            continue
+        key = tuple(values.get(column) for column in SERIES_FLUX_COLUMNS)
+        entry = series.get(key)
+        if entry is None:
+            entry = series[key] = {**dict(zip(SERIES_COLUMNS, key)), "t": [], "v": []}
+        entry["t"].append(round(ts.timestamp() * 1000))
+        entry["v"].append(float(value))
+    return list(series.values())
 
 
 class InfluxService:
@@ -11,7 +76,28 @@ class InfluxService:
         self.client: Optional[InfluxDBClient] = None
         self.write_api = None
         self.query_api = None
-        self.flush_task = None
+        self._query_executor: Optional[ThreadPoolExecutor] = None
+        self._write_queue: queue.Queue = queue.Queue(maxsize=settings.influx.write_queue_size)
+        self._writer_thread: Optional[threading.Thread] = None
+        self._stats_lock = threading.Lock()
+        self._write_stats = {
+            "queued": 0,
+            "written": 0,
+            "dropped": 0,
+            "failed": 0,
+            "batches": 0,
+            "spooled": 0,
+            "rejected": 0,
+        }
+        self._written_at: Optional[datetime] = None
+        # Batches go to the disk spool while set, the replay thread clears it
+        self.spool: Optional[Spool] = None
+        self._influx_down = threading.Event()
+        self._spool_ready = threading.Event()
+        self._replay_stop = threading.Event()
+        self._replay_thread: Optional[threading.Thread] = None
+        # Kept up to date by the rollup service, history queries pick from them
+        self.rollups: List[Rollup] = []
 
     def initialize(self):
         """Initialize InfluxDB client and APIs"""
@@ -22,22 +108,51 @@ class InfluxService:
         )
         self.write_api = self.client.write_api(write_options=SYNCHRONOUS)
         self.query_api = self.client.query_api()
+        # Flux queries block, they run on a bounded pool instead of the event loop
+        self._query_executor = ThreadPoolExecutor(
+            max_workers=max(1, settings.influx.query_concurrency),
+            thread_name_prefix="influx-query"
+        )
+
+        # Storage writes happen on a dedicated thread, never on the MQTT one
+        self._writer_thread = threading.Thread(
+            target=self._run_writer,
+            name="influx-writer",
+            daemon=True
+        )
+        self._writer_thread.start()
+
+        # Batches InfluxDB refused are kept on disk and replayed once it is back
+        if settings.spool.dir:
+            self.spool = Spool(
+                directory=settings.spool.dir,
+                segment_bytes=settings.spool.segment_mb * 1024 * 1024,
+                max_bytes=settings.spool.max_mb * 1024 * 1024,
+                fsync_interval=settings.spool.fsync_interval_ms / 1000
+            )
+            self._replay_stop.clear()
+            self._influx_down.clear()
+            self._replay_thread = threading.Thread(
+                target=self._run_replay,
+                name="influx-replay",
+                daemon=True
+            )
+            self._replay_thread.start()
         
         print(f"✓ InfluxDB client initialized")
         print(f"  URL: {settings.influx.url}")
         print(f"  Org: {settings.influx.org}")
         print(f"  Bucket: {settings.influx.bucket}")
 
-    async def health_check(self) -> bool:
-        """Check if InfluxDB is accessible"""
-        if not self.query_api:
+    async def ping(self, timeout: float) -> bool:
+        """Check that InfluxDB answers its /ping endpoint, off the event loop and the query pool"""
+        if not self.client:
             return False
 
+        loop = asyncio.get_running_loop()
         try:
-            await self.query_history(range_time="1m")
-            return True
-        except Exception as e:
-            print(f"InfluxDB health check failed: {e}")
+            return await asyncio.wait_for(loop.run_in_executor(None, self.client.ping), timeout=timeout)
+        except asyncio.TimeoutError:
             return False
 
     async def query_history(
@@ -45,141 +160,653 @@ class InfluxService:
         sensor: Optional[str] = None,
         room: Optional[str] = None,
         metric: Optional[str] = None,
-        range_time: str = "24h"
+        range_time: str = "24h",
+        every: Optional[str] = None,
+        fn: str = "mean",
+        max_points: Optional[int] = None,
+        since: Optional[datetime] = None,
+        downsample: str = "window"
     ) -> List[Dict[str, Any]]:
-        """Query historical sensor data from InfluxDB"""
+        """
+        Query historical sensor data from InfluxDB.
+        `every` or `max_points` (per series) aggregate windows server-side with `fn`;
+        downsample="lttb" instead keeps max_points shape-preserving raw points per series.
+        `since` keeps only points strictly newer than it.
+        """
         if not self.query_api:
             return []
 
+        every, lttb_points, rollup = self._downsampling(range_time, every, max_points, downsample, since)
+        flux_query = self._history_flux(sensor, room, metric, range_time, every, fn, since, rollup)
+
+        rows = await self._history_query(flux_query)
+        return lttb_rows(rows, lttb_points) if lttb_points else rows
+
+    async def query_history_columnar(
+        self,
+        sensor: Optional[str] = None,
+        room: Optional[str] = None,
+        metric: Optional[str] = None,
+        range_time: str = "24h",
+        every: Optional[str] = None,
+        fn: str = "mean",
+        max_points: Optional[int] = None,
+        since: Optional[datetime] = None,
+        downsample: str = "window"
+    ) -> List[Dict[str, Any]]:
+        """Same query as query_history, grouped into series by columnar_series"""
+        if not self.query_api:
+            return []
+
+        every, lttb_points, rollup = self._downsampling(range_time, every, max_points, downsample, since)
+        flux_query = self._history_flux(sensor, room, metric, range_time, every, fn, since, rollup)
+        flux_query += f'  |> keep(columns: {json.dumps(["_time", "_value", *SERIES_FLUX_COLUMNS])})\n'
+
+        series = await self._history_query(flux_query, columnar_series)
+        return [lttb_series(entry, lttb_points) for entry in series] if lttb_points else series
+
+    async def _history_query(self, flux_query: str, reduce: Optional[Callable[[Iterable[FluxRecord]], Any]] = None) -> Any:
+        try:
+            return await self._run_query(flux_query, reduce)
+        except asyncio.TimeoutError:
+            print(f"InfluxDB query timed out after {settings.influx.query_timeout_ms} ms")
+            raise
+        except Exception as e:
+            print(f"InfluxDB query failed: {e}")
+            raise
+
+    async def stream_history(
+        self,
+        sensor: Optional[str] = None,
+        room: Optional[str] = None,
+        metric: Optional[str] = None,
+        range_time: str = "24h",
+        every: Optional[str] = None,
+        fn: str = "mean",
+        max_points: Optional[int] = None,
+        since: Optional[datetime] = None,
+        chunk_size: int = 1000
+    ) -> AsyncIterator[List[Tuple[Any, ...]]]:
+        """
+        Stream historical data as chunks of STREAM_COLUMNS tuples.
+        Only one chunk is held in memory at a time.
+        """
+        if not self.query_api:
+            return
+
+        every, _, rollup = self._downsampling(range_time, every, max_points, "window", since)
+        flux_query = self._history_flux(sensor, room, metric, range_time, every, fn, since, rollup)
+        flux_query += f'  |> keep(columns: {json.dumps(STREAM_FLUX_COLUMNS)})\n'
+
+        loop = asyncio.get_running_loop()
+        timeout = settings.influx.query_timeout_ms / 1000
+        cancelled = threading.Event()
+        # Serializes reads and close() of the record generator across pool threads
+        lock = threading.Lock()
+        records = None
+
+        def take() -> List[Tuple[Any, ...]]:
+            nonlocal records
+            with lock:
+                if cancelled.is_set():
+                    return []
+                if records is None:
+                    records = self.query_api.query_stream(flux_query, org=settings.influx.org)
+                return [
+                    tuple(record.values.get(column) for column in STREAM_FLUX_COLUMNS)
+                    for record in islice(records, chunk_size)
+                ]
+
+        def close():
+            if records is not None:
+                records.close()
+
+        def close_when_idle():
+            with lock:
+                close()
+
+        try:
+            while True:
+                chunk = await asyncio.wait_for(loop.run_in_executor(self._query_executor, take), timeout=timeout)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            cancelled.set()
+            if lock.acquire(blocking=False):
+                try:
+                    close()
+                finally:
+                    lock.release()
+            else:
+                # A pool thread is still reading, close once it is done
+                self._query_executor.submit(close_when_idle)
+
+    def _downsampling(
+        self,
+        range_time: str,
+        every: Optional[str],
+        max_points: Optional[int],
+        downsample: str,
+        since: Optional[datetime]
+    ) -> Tuple[Optional[str], Optional[int], Optional[Rollup]]:
+        """
+        Aggregation window, LTTB point budget and rollup of a history query.
+        At most one of the window and the budget is set, a rollup only with a window.
+        """
+        lttb_points = max_points if downsample == "lttb" and not every else None
+        if lttb_points:
+            return None, lttb_points, None
+        window = self._aggregation_window(range_time, every, max_points)
+        if window is None:
+            return None, None, None
+        rollup, window = self._select_rollup(range_time, window, bool(every), since)
+        return window, None, rollup
+
+    def _select_rollup(
+        self,
+        range_time: str,
+        window: str,
+        exact: bool,
+        since: Optional[datetime]
+    ) -> Tuple[Optional[Rollup], str]:
+        """
+        Coarsest ready rollup covering the query start whose resolution fits the window.
+        An explicit window must be a multiple of it, one derived from max_points is
+        rounded up to the next multiple, which keeps it within the point budget.
+        """
+        start = self._query_start(range_time, since)
+        if start is None or not is_duration(window):
+            return None, window
+        seconds = parse_duration(window)
+        for rollup in sorted(self.rollups, key=lambda rollup: rollup.seconds, reverse=True):
+            if rollup.seconds > seconds or not rollup.covers(start):
+                continue
+            if not exact:
+                return rollup, f"{math.ceil(seconds / rollup.seconds) * rollup.seconds}s"
+            if seconds % rollup.seconds == 0:
+                return rollup, window
+        return None, window
+
+    @staticmethod
+    def _aggregation_window(range_time: str, every: Optional[str], max_points: Optional[int]) -> Optional[str]:
+        """Window to aggregate with, derived from max_points when every is not given"""
+        if every:
+            return every
+        if max_points:
+            return window_for(range_time, max_points)
+        return None
+
+    @staticmethod
+    def _history_flux(
+        sensor: Optional[str],
+        room: Optional[str],
+        metric: Optional[str],
+        range_time: str,
+        every: Optional[str] = None,
+        fn: str = "mean",
+        since: Optional[datetime] = None,
+        rollup: Optional[Rollup] = None
+    ) -> str:
+        # Each filter takes a comma-separated list, fetched in this one query
         filters = []
-        if sensor:
-            filters.append(f'r.sensor_id == "{sensor}"')
-        if room:
-            filters.append(f'r.room == "{room}"')
-        if metric:
-            filters.append(f'r.metric == "{metric}"')
+        for column, values in (("sensor_id", sensor), ("room", room), ("metric", metric)):
+            if values:
+                filters.append(InfluxService._any_of(column, values))
+
+        if rollup is not None:
+            return InfluxService._rollup_history_flux(filters, range_time, every, fn, since, rollup)
 
         filter_clause = ""
         if filters:
             filter_clause = f'|> filter(fn: (r) => {" and ".join(filters)})'
 
-        flux_query = f'''
+        aggregate_clause = ""
+        if every:
+            aggregate_clause = f'|> aggregateWindow(every: {every}, fn: {fn}, createEmpty: false)'
+
+        return f'''
 from(bucket: "{settings.influx.bucket}")
-  |> range(start: -{range_time})
+  |> range(start: {InfluxService._range_start(range_time, since)})
   {filter_clause}
+  {aggregate_clause}
 '''
 
-        try:
-            tables = self.query_api.query(flux_query, org=settings.influx.org)
-            rows = []
-            
-            for table in tables:
-                for record in table.records:
-                    rows.append({
-                        "time": record.get_time(),
-                        "measurement": record.get_measurement(),
-                        "field": record.get_field(),
-                        "value": record.get_value(),
-                        **record.values
-                    })
-            
-            return rows
-        except Exception as e:
-            print(f"InfluxDB query failed: {e}")
-            raise
+    @staticmethod
+    def _rollup_history_flux(
+        filters: List[str],
+        range_time: str,
+        every: str,
+        fn: str,
+        since: Optional[datetime],
+        rollup: Rollup
+    ) -> str:
+        """
+        Windows read from the rollup up to where it is aggregated, and from raw points after that.
+        Raw points are first aggregated to the rollup resolution, so both sides have the same
+        granularity. Re-aggregating means of rollup windows weighs each window equally.
+        """
+        tag_filter = "".join(f" and {predicate}" for predicate in filters)
+        done_until = InfluxService._flux_time(rollup.done_until)
+        return f'''
+rolled = from(bucket: "{rollup.bucket}")
+  |> range(start: {InfluxService._range_start(range_time, since)}, stop: {done_until})
+  |> filter(fn: (r) => r._measurement == "telemetry" and r._field == "{fn}"{tag_filter})
+  |> set(key: "_field", value: "value")
+recent = from(bucket: "{settings.influx.bucket}")
+  |> range(start: {done_until})
+  |> filter(fn: (r) => r._measurement == "telemetry" and r._field == "value"{tag_filter})
+  |> aggregateWindow(every: {rollup.every}, fn: {fn}, timeSrc: "_start", createEmpty: false)
+union(tables: [rolled, recent])
+  |> group(columns: {json.dumps(SERIES_FLUX_COLUMNS)})
+  |> sort(columns: ["_time"])
+  |> aggregateWindow(every: {every}, fn: {fn}, createEmpty: false)
+'''
+
+    @staticmethod
+    def _query_start(range_time: str, since: Optional[datetime]) -> Optional[datetime]:
+        """Absolute start of a history query, None when the range is not a duration"""
+        if not is_duration(range_time):
+            return None
+        start = datetime.now(timezone.utc) - timedelta(seconds=parse_duration(range_time))
+        if since is not None:
+            start = max(start, since.astimezone(timezone.utc) + timedelta(milliseconds=1))
+        return start
+
+    @staticmethod
+    def _range_start(range_time: str, since: Optional[datetime]) -> str:
+        """Flux range start: the relative range, or just after `since` when that is later"""
+        if since is None:
+            return f"-{range_time}"
+        # Points are stored at millisecond precision
+        after = since.astimezone(timezone.utc) + timedelta(milliseconds=1)
+        if is_duration(range_time) and after <= datetime.now(timezone.utc) - timedelta(seconds=parse_duration(range_time)):
+            return f"-{range_time}"
+        return InfluxService._flux_time(after)
+
+    @staticmethod
+    def _flux_time(value: datetime) -> str:
+        return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+    @staticmethod
+    def _any_of(column: str, values: str) -> str:
+        """Flux predicate matching any of the comma-separated values"""
+        matches = [f'r.{column} == {flux_string(value.strip())}' for value in values.split(",") if value.strip()]
+        return matches[0] if len(matches) == 1 else f'({" or ".join(matches)})'
 
     async def query_latest(
         self,
         room: Optional[str] = None,
         sensor_id: Optional[str] = None,
-        range_time: str = "1h"
+        range_time: str = "1h",
+        since: Optional[datetime] = None
     ) -> List[Dict[str, Any]]:
-        """Query latest telemetry per metric from InfluxDB"""
+        """Query latest telemetry per metric from InfluxDB, only series updated after `since` when given"""
         if not self.query_api:
             return []
 
         filters = ['r._measurement == "telemetry"']
         if room:
-            filters.append(f'r.room == "{room}"')
+            filters.append(f'r.room == {flux_string(room)}')
         if sensor_id:
-            filters.append(f'r.sensor_id == "{sensor_id}"')
+            filters.append(f'r.sensor_id == {flux_string(sensor_id)}')
 
         filter_clause = " and ".join(filters)
 
         flux_query = f'''
 from(bucket: "{settings.influx.bucket}")
-  |> range(start: -{range_time})
+  |> range(start: {self._range_start(range_time, since)})
   |> filter(fn: (r) => {filter_clause})
   |> group(columns: ["metric", "sensor_id", "room"])
   |> last()
 '''
 
         try:
-            tables = self.query_api.query(flux_query, org=settings.influx.org)
-            rows = []
-            for table in tables:
-                for record in table.records:
-                    rows.append({
-                        "time": record.get_time(),
-                        "measurement": record.get_measurement(),
-                        "field": record.get_field(),
-                        "value": record.get_value(),
-                        **record.values
-                    })
-            return rows
+            return await self._run_query(flux_query, self._records_to_latest_rows)
+        except asyncio.TimeoutError:
+            print(f"InfluxDB latest query timed out after {settings.influx.query_timeout_ms} ms")
+            raise
         except Exception as e:
             print(f"InfluxDB latest query failed: {e}")
             raise
 
+    async def ensure_bucket(self, name: str):
+        """Create a bucket in the configured org unless it already exists"""
+        def ensure():
+            buckets_api = self.client.buckets_api()
+            if buckets_api.find_bucket_by_name(name) is None:
+                buckets_api.create_bucket(bucket_name=name, org=settings.influx.org)
+                print(f"✓ InfluxDB bucket created: {name}")
+
+        await asyncio.get_running_loop().run_in_executor(self._query_executor, ensure)
+
+    async def rollup_state(self, rollup: Rollup) -> Optional[Tuple[datetime, datetime]]:
+        """Span a rollup bucket was aggregated over, as saved by save_rollup_state"""
+        rows = await self._run_query(f'''
+from(bucket: "{rollup.bucket}")
+  |> range(start: 0)
+  |> filter(fn: (r) => r._measurement == "{ROLLUP_STATE_MEASUREMENT}")
+  |> last()
+''')
+        state = {row["field"]: row["value"] for row in rows}
+        if "covers_from" not in state or "done_until" not in state:
+            return None
+        return (
+            datetime.fromtimestamp(state["covers_from"] / 1000, tz=timezone.utc),
+            datetime.fromtimestamp(state["done_until"] / 1000, tz=timezone.utc)
+        )
+
+    async def save_rollup_state(self, rollup: Rollup, covers_from: datetime, done_until: datetime):
+        point = (
+            Point(ROLLUP_STATE_MEASUREMENT)
+            .field("covers_from", int(covers_from.timestamp() * 1000))
+            .field("done_until", int(done_until.timestamp() * 1000))
+            .time(to_epoch_ms(None), WritePrecision.MS)
+        )
+        await asyncio.get_running_loop().run_in_executor(self._query_executor, lambda: self.write_api.write(
+            bucket=rollup.bucket,
+            org=settings.influx.org,
+            record=point,
+            write_precision=WritePrecision.MS
+        ))
+
+    async def aggregate_rollup(self, rollup: Rollup, start: datetime, stop: datetime):
+        """Aggregate the raw points of [start, stop) into the rollup bucket, one field per function"""
+        flux_query = f'''
+data = from(bucket: "{settings.influx.bucket}")
+  |> range(start: {self._flux_time(start)}, stop: {self._flux_time(stop)})
+  |> filter(fn: (r) => r._measurement == "telemetry" and r._field == "value")
+'''
+        for fn in AGGREGATE_FUNCTIONS:
+            flux_query += f'''
+data
+  |> aggregateWindow(every: {rollup.every}, fn: {fn}, timeSrc: "_start", createEmpty: false)
+  |> set(key: "_field", value: "{fn}")
+  |> to(bucket: "{rollup.bucket}", org: "{settings.influx.org}")
+  |> count()
+  |> yield(name: "{fn}")
+'''
+        # Only the per-series counts come back, nothing to keep
+        await self._run_query(flux_query, lambda records: sum(1 for _ in records))
+
+    async def _run_query(self, flux_query: str, reduce: Optional[Callable[[Iterable[FluxRecord]], Any]] = None) -> Any:
+        """
+        Run a Flux query on the query pool with a timeout.
+        Records are turned into the result by `reduce` on the pool thread, one row dict each by default.
+        Cancelling the caller stops reading the response and closes it.
+        """
+        loop = asyncio.get_running_loop()
+        cancelled = threading.Event()
+        reduce = reduce or self._records_to_rows
+
+        def collect() -> Any:
+            records = self.query_api.query_stream(flux_query, org=settings.influx.org)
+            try:
+                return reduce(takewhile(lambda _: not cancelled.is_set(), records))
+            finally:
+                records.close()
+
+        started = time.monotonic()
+        future = loop.run_in_executor(self._query_executor, collect)
+        try:
+            return await asyncio.wait_for(future, timeout=settings.influx.query_timeout_ms / 1000)
+        finally:
+            cancelled.set()
+            INFLUX_QUERY_DURATION.observe(time.monotonic() - started)
+
+    @classmethod
+    def _records_to_rows(cls, records: Iterable[FluxRecord]) -> List[Dict[str, Any]]:
+        return [cls._record_to_row(record) for record in records]
+
+    @staticmethod
+    def _records_to_latest_rows(records: Iterable[FluxRecord]) -> List[Dict[str, Any]]:
+        return [
+            latest_row(record.values.get("room"), record.values.get("sensor_id"), record.values.get("metric"),
+                       record.get_value(), record.get_time())
+            for record in records
+        ]
+
+    @staticmethod
+    def _record_to_row(record: FluxRecord) -> Dict[str, Any]:
+        return {
+            "time": record.get_time(),
+            "measurement": record.get_measurement(),
+            "field": record.get_field(),
+            "value": record.get_value(),
+            **record.values
+        }
+
     def write_telemetry(
         self,
         room: str,
         sensor_id: str,
         metric: str,
         value: float,
-        ts: Optional[int] = None
-    ):
-        """Write telemetry data to InfluxDB"""
+        ts: Optional[int] = None,
+        received_at: Optional[float] = None
+    ) -> bool:
+        """Queue telemetry data for the background InfluxDB writer, received_at is the monotonic MQTT receive time"""
         if not self.write_api:
+            return False
+
+        item = (room, sensor_id, metric, float(value), to_epoch_ms(ts), received_at or time.monotonic())
+        block_timeout = settings.influx.write_block_timeout_ms / 1000
+
+        try:
+            if block_timeout > 0:
+                self._write_queue.put(item, timeout=block_timeout)
+            else:
+                self._write_queue.put_nowait(item)
+        except queue.Full:
+            self._count("dropped")
+            if settings.debug:
+                print(f"Influx write queue full, dropping telemetry: {sensor_id}/{metric}")
+            return False
+
+        self._count("queued")
+        return True
+
+    def _run_writer(self):
+        """Drain the write queue, flushing by batch size or interval"""
+        batch_size = max(1, settings.influx.write_batch_size)
+        interval = max(0.01, settings.influx.write_flush_interval_ms / 1000)
+        batch: List[Point] = []
+        received_at: List[float] = []
+        deadline = time.monotonic() + interval
+
+        while True:
+            try:
+                item = self._write_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, tuple):
+                batch.append(self._to_point(*item[:5]))
+                received_at.append(item[5])
+                if len(batch) < batch_size and time.monotonic() < deadline:
+                    continue
+
+            if batch:
+                self._store_batch(batch, received_at)
+                batch = []
+                received_at = []
+            if self.spool:
+                self.spool.sync()
+            deadline = time.monotonic() + interval
+
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _STOP:
+                return
+
+    def _store_batch(self, batch: List[Point], received_at: List[float]):
+        """Write a batch, or spool it to disk while InfluxDB fails"""
+        if not self._influx_down.is_set():
+            if self._write_batch(batch):
+                now = time.monotonic()
+                INGEST_TO_STORAGE.observe_many(now - t for t in received_at)
+                return
+            if self.spool:
+                print("InfluxDB unavailable, spooling telemetry to disk")
+                self._influx_down.set()
+
+        if not self.spool:
+            self._count("failed", len(batch))
             return
+        try:
+            self.spool.append([point.to_line_protocol() for point in batch])
+        except OSError as e:
+            self._count("failed", len(batch))
+            print(f"Failed to spool telemetry batch ({len(batch)} points): {e}")
+            return
+        self._count("spooled", len(batch))
+        self._spool_ready.set()
 
-        now_ms = int(datetime.now().timestamp() * 1000)
-        timestamp = now_ms
-        if ts and isinstance(ts, (int, float)):
-            ts_int = int(ts)
-            if ts_int >= 1_000_000_000_000:
-                timestamp = ts_int
-            elif ts_int >= 1_600_000_000:
-                timestamp = ts_int * 1000
+    def _run_replay(self):
+        """Write spooled points back in order, at most replay_max_points_per_s"""
+        batch_size = max(1, settings.spool.replay_batch_size)
+        rate = max(1, settings.spool.replay_max_points_per_s)
 
-        point = (
+        while not self._replay_stop.is_set():
+            self._spool_ready.clear()
+            lines, cursor = self.spool.read(batch_size)
+            if not lines:
+                self._spool_ready.wait(timeout=1.0)
+                continue
+
+            started = time.monotonic()
+            try:
+                self.write_api.write(
+                    bucket=settings.influx.bucket,
+                    org=settings.influx.org,
+                    record=lines,
+                    write_precision=WritePrecision.MS
+                )
+                self._record_written(len(lines))
+            except ApiException as e:
+                if e.status not in REJECTED_WRITE_STATUSES:
+                    self._replay_failed(e)
+                    continue
+                # Retrying would block the spool forever
+                self._count("rejected", len(lines))
+                print(f"InfluxDB rejected {len(lines)} spooled points: {e.status} {e.reason}")
+            except Exception as e:
+                self._replay_failed(e)
+                continue
+
+            if self._influx_down.is_set():
+                self._influx_down.clear()
+                print("✓ InfluxDB back, replaying spooled telemetry")
+            self.spool.commit(cursor)
+            # Leave InfluxDB room for live writes and queries
+            self._replay_stop.wait(max(0.0, len(lines) / rate - (time.monotonic() - started)))
+
+    def _replay_failed(self, error: Exception):
+        if not self._influx_down.is_set():
+            self._influx_down.set()
+            print(f"Spool replay failed, retrying every {settings.spool.retry_interval_s}s: {error}")
+        self._replay_stop.wait(settings.spool.retry_interval_s)
+
+    def _record_written(self, count: int):
+        with self._stats_lock:
+            self._write_stats["written"] += count
+            self._write_stats["batches"] += 1
+            self._written_at = datetime.now(timezone.utc)
+
+    @staticmethod
+    def _to_point(room: str, sensor_id: str, metric: str, value: float, timestamp: int) -> Point:
+        return (
             Point("telemetry")
             .tag("room", room)
             .tag("sensor_id", sensor_id)
             .tag("metric", metric)
-            .field("value", float(value))
+            .field("value", value)
             .time(timestamp, WritePrecision.MS)
         )
 
+    def _write_batch(self, points: List[Point]) -> bool:
+        """Write one batch of points, counting failures instead of raising"""
+        started = time.monotonic()
         try:
             self.write_api.write(
                 bucket=settings.influx.bucket,
                 org=settings.influx.org,
-                record=point
+                record=points,
+                write_precision=WritePrecision.MS
             )
+            self._record_written(len(points))
+            return True
         except Exception as e:
-            print(f"Failed to write telemetry: {e}")
+            print(f"Failed to write telemetry batch ({len(points)} points): {e}")
+            return False
+        finally:
+            INFLUX_WRITE_DURATION.observe(time.monotonic() - started)
 
-    async def flush(self):
-        """Flush any pending writes"""
-        if self.write_api:
-            try:
-                self.write_api.flush()
-            except Exception as e:
-                print(f"InfluxDB flush failed: {e}")
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self._write_stats[key] += amount
+
+    def data_version(self) -> Tuple[int, Optional[datetime]]:
+        """Written batch count and time of the last one, they change whenever stored data does"""
+        with self._stats_lock:
+            return self._write_stats["batches"], self._written_at
+
+    def spool_stats(self) -> Optional[Dict[str, Any]]:
+        """Spool depth and replay progress, None when spooling is disabled"""
+        if not self.spool:
+            return None
+        return {**self.spool.stats(), "influx_down": self._influx_down.is_set()}
+
+    async def spool_oldest_pending(self) -> Optional[datetime]:
+        """Time of the oldest spooled point not replayed into InfluxDB yet"""
+        if not self.spool:
+            return None
+        oldest = await asyncio.get_running_loop().run_in_executor(self._query_executor, self.spool.oldest_pending_ms)
+        return datetime.fromtimestamp(oldest / 1000, tz=timezone.utc) if oldest is not None else None
+
+    def write_stats(self) -> Dict[str, int]:
+        """Counters of the background write pipeline"""
+        with self._stats_lock:
+            stats = dict(self._write_stats)
+        stats["pending"] = self._write_queue.qsize()
+        return stats
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Block until every queued point has been sent to InfluxDB"""
+        if not self._writer_thread or not self._writer_thread.is_alive():
+            return True
+
+        done = threading.Event()
+        try:
+            self._write_queue.put(done, timeout=timeout)
+        except queue.Full:
+            print("InfluxDB flush failed: write queue full")
+            return False
+
+        if not done.wait(timeout):
+            print("InfluxDB flush timed out")
+            return False
+        return True
 
     def close(self):
-        """Close InfluxDB client connection"""
+        """Stop the writer thread and close InfluxDB client connection"""
+        if self._writer_thread and self._writer_thread.is_alive():
+            self._write_queue.put(_STOP)
+            self._writer_thread.join(timeout=10.0)
+            self._writer_thread = None
+
+        if self._replay_thread and self._replay_thread.is_alive():
+            self._replay_stop.set()
+            self._spool_ready.set()
+            self._replay_thread.join(timeout=10.0)
+            self._replay_thread = None
+        if self.spool:
+            self.spool.close()
+
+        if self._query_executor:
+            self._query_executor.shutdown(wait=False, cancel_futures=True)
+            self._query_executor = None
+
         if self.client:
             self.client.close()
             print("InfluxDB connection closed")
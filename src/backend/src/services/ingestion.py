@@ -0,0 +1,204 @@
+"""
+Telemetry ingestion pipeline.
+
+MQTT payloads are parsed once, straight from bytes (orjson when available),
+then mapped to a Reading by the normalizer registered for the topic filter.
+Each normalizer prebuilds its field alias lookups once, so per-message work
+is a few dict lookups and one float conversion.
+"""
+
+import json
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from config.env import settings
+from services.dedup import DedupWindow
+
+try:
+    import orjson
+
+    def loads(data: bytes) -> Any:
+        """Parse JSON from bytes, raises ValueError on invalid input"""
+        return orjson.loads(data)
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    def loads(data: bytes) -> Any:
+        """Parse JSON from bytes, raises ValueError on invalid input"""
+        return json.loads(data)
+
+
+class Reading(NamedTuple):
+    room: str
+    sensor_id: str
+    metric: str
+    value: float
+    ts: Any
+    # time.monotonic() when the MQTT message was received
+    received_at: Optional[float] = None
+
+
+def _lookup(keys: Sequence[str]) -> Callable[[Callable[[str], Any]], Any]:
+    """First non-empty alias, like `get(x) or get(y)`"""
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda get: get(key)
+    first, last = tuple(keys[:-1]), keys[-1]
+
+    def lookup(get: Callable[[str], Any]) -> Any:
+        for key in first:
+            found = get(key)
+            if found:
+                return found
+        return get(last)
+    return lookup
+
+
+def _build(fields: Dict[str, Sequence[str]]) -> Callable[[Any], Optional[Reading]]:
+    """
+    normalize(data) for one payload format, closing over its prebuilt alias lookups.
+    value aliases are tried by presence, so a 0 value is kept.
+    """
+    room_of, sensor_of, metric_of, ts_of = (_lookup(fields[name]) for name in ("room", "sensor_id", "metric", "ts"))
+    value_keys = tuple(fields["value"])
+
+    def normalize(data: Any, received_at: Optional[float] = None) -> Optional[Reading]:
+        if not isinstance(data, dict):
+            return None
+        get = data.get
+        room = room_of(get)
+        sensor_id = sensor_of(get)
+        metric = metric_of(get)
+        if not (room and sensor_id and metric):
+            return None
+        for key in value_keys:
+            value = get(key)
+            if value is not None:
+                break
+        else:
+            return None
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return None
+        return Reading(room, sensor_id, metric, value, ts_of(get), received_at)
+    return normalize
+
+
+class Normalizer:
+    """Maps one payload format to a Reading, field aliases are tried in order"""
+
+    def __init__(
+        self,
+        name: str,
+        topic: str,
+        room: Sequence[str],
+        sensor_id: Sequence[str],
+        metric: Sequence[str],
+        value: Sequence[str],
+        ts: Sequence[str]
+    ):
+        self.name = name
+        self.topic = topic
+        self.normalize = _build({
+            "room": room,
+            "sensor_id": sensor_id,
+            "metric": metric,
+            "value": value,
+            "ts": ts,
+        })
+
+    def __call__(self, data: Any, received_at: Optional[float] = None) -> Optional[Reading]:
+        """Reading from a decoded payload, None if fields are missing or invalid"""
+        return self.normalize(data, received_at)
+
+
+# Format published by the sensors themselves and by the gateway
+TELEMETRY = Normalizer(
+    "telemetry",
+    topic="sensors/+/telemetry",
+    room=("room",),
+    sensor_id=("sensor_id",),
+    metric=("metric",),
+    value=("value",),
+    ts=("ts",)
+)
+
+# Raw EcoGuard format (ecoguard/sensors/<device>/<type>)
+ECOGUARD = Normalizer(
+    "ecoguard",
+    topic="ecoguard/sensors/+/+",
+    room=("room_id", "room"),
+    sensor_id=("device_id", "sensor_id", "parent_device_id"),
+    metric=("sensor_type", "metric"),
+    value=("value", "amplitude"),
+    ts=("timestamp", "ts")
+)
+
+
+def dedup_key(reading: Reading) -> Optional[Tuple[str, str, Any]]:
+    """(sensor_id, metric, ts) identity of a reading, s and ms timestamps compare equal"""
+    ts = reading.ts
+    if ts is None or ts == "":
+        return None
+    if isinstance(ts, (int, float)):
+        ts = int(ts) if ts >= 1_000_000_000_000 else int(ts * 1000)
+    return reading.sensor_id, reading.metric, ts
+
+
+class IngestionPipeline:
+    """
+    Normalizes telemetry messages and hands each Reading to the registered sinks.
+    With a dedup window, readings already seen through another topic or an
+    MQTT redelivery are dropped before reaching the sinks, and the handler
+    returns False so the MQTT service skips the /ws fan-out too.
+    Called from the MQTT dispatcher threads.
+    """
+
+    def __init__(self, dedup: Optional[DedupWindow] = None):
+        self.sinks: List[Callable[[Reading], None]] = []
+        self.dedup = dedup
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def add_sink(self, sink: Callable[[Reading], None]):
+        self.sinks.append(sink)
+
+    def handler(self, normalizer: Normalizer) -> Callable[[str, Any, bytes, Optional[float]], Optional[bool]]:
+        """MQTT subscription handler feeding payloads through a normalizer"""
+        normalize = normalizer.normalize
+        counters = self._counters(normalizer.name)
+        lock = self._stats_lock
+        sinks = self.sinks
+        dedup = self.dedup
+
+        def handle(topic: str, payload: Any, raw_message: bytes, received_at: Optional[float] = None):
+            reading = normalize(payload, received_at)
+            if reading is None:
+                with lock:
+                    counters["rejected"] += 1
+                if settings.debug:
+                    print(f"MQTT {normalizer.name} payload rejected: {topic}, {payload}")
+                return
+            if dedup is not None:
+                key = dedup_key(reading)
+                if key is not None and not dedup.add(key):
+                    return False
+            with lock:
+                counters["ingested"] += 1
+            for sink in sinks:
+                sink(reading)
+        return handle
+
+    def _counters(self, source: str) -> Dict[str, int]:
+        with self._stats_lock:
+            return self._stats.setdefault(source, {"ingested": 0, "rejected": 0})
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Ingested/rejected counters per source"""
+        with self._stats_lock:
+            return {source: dict(counters) for source, counters in self._stats.items()}
+
+
+# Singleton instance
+ingestion = IngestionPipeline(
+    dedup=DedupWindow(settings.dedup.window_s, settings.dedup.max_entries) if settings.dedup.window_s > 0 else None
+)
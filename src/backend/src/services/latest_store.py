@@ -0,0 +1,84 @@
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def latest_row(room: str, sensor_id: str, metric: str, value: Any, time: datetime) -> Dict[str, Any]:
+    """Row served by /latest, the same whether it comes from the store or from InfluxDB"""
+    return {
+        "time": time.astimezone(timezone.utc),
+        "measurement": "telemetry",
+        "field": "value",
+        "value": value,
+        "room": room,
+        "sensor_id": sensor_id,
+        "metric": metric,
+    }
+
+
+class LatestValueStore:
+    """
+    In-process latest value per series, indexed room -> sensor_id -> metric.
+    Fed by MQTT ingestion and warmed from InfluxDB at startup.
+    The version is bumped by every stored change, so pollers can tell when nothing moved.
+    """
+
+    def __init__(self):
+        self._rooms: Dict[str, Dict[str, Dict[str, Dict[str, Any]]]] = {}
+        self._lock = threading.Lock()
+        self._version = 0
+        self._modified_at: Optional[datetime] = None
+        self.warmed = False
+
+    def data_version(self) -> Tuple[int, Optional[datetime]]:
+        """Change counter and wall-clock time of the last change"""
+        with self._lock:
+            return self._version, self._modified_at
+
+    def update(self, room: str, sensor_id: str, metric: str, value: float, timestamp_ms: int):
+        """Record a value unless a newer one is already stored"""
+        time = datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc)
+        self._set(room, sensor_id, metric, latest_row(room, sensor_id, metric, value, time))
+
+    def warm(self, rows: List[Dict[str, Any]]):
+        """Load rows returned by InfluxService.query_latest"""
+        for row in rows:
+            room, sensor_id, metric = row.get("room"), row.get("sensor_id"), row.get("metric")
+            if not all([room, sensor_id, metric]) or row.get("time") is None:
+                continue
+            self._set(room, sensor_id, metric, latest_row(room, sensor_id, metric, row.get("value"), row["time"]))
+
+    def query(
+        self,
+        room: Optional[str] = None,
+        sensor_id: Optional[str] = None,
+        newer_than: Optional[datetime] = None
+    ) -> List[Dict[str, Any]]:
+        """Latest rows matching the filters, optionally only those newer than a time"""
+        with self._lock:
+            rooms = [self._rooms.get(room, {})] if room else list(self._rooms.values())
+            rows = []
+            for sensors in rooms:
+                if sensor_id:
+                    metrics = [sensors.get(sensor_id, {})]
+                else:
+                    metrics = list(sensors.values())
+                for by_metric in metrics:
+                    rows.extend(by_metric.values())
+
+        if newer_than is not None:
+            rows = [row for row in rows if row["time"] > newer_than]
+        return rows
+
+    def _set(self, room: str, sensor_id: str, metric: str, row: Dict[str, Any]):
+        with self._lock:
+            by_metric = self._rooms.setdefault(room, {}).setdefault(sensor_id, {})
+            current = by_metric.get(metric)
+            if current is None or current["time"] <= row["time"]:
+                by_metric[metric] = row
+                self._version += 1
+                self._modified_at = datetime.now(timezone.utc)
+
+
+# Singleton instance
+latest_store = LatestValueStore()
@@ -0,0 +1,154 @@
+"""
+Minimal Prometheus instrumentation, rendered in the text exposition format by /metrics.
+
+Hot paths only pay for what they record: one histogram bucket increment
+under a short lock. Everything already tracked elsewhere
+(queue depths, client counts, pipeline counters) is read by collectors at
+scrape time, so it costs nothing between scrapes.
+"""
+
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+Labels = Dict[str, str]
+Sample = Tuple[Labels, float]
+
+# Seconds, from sub-millisecond in-memory hops to multi-second Influx calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.type = "histogram"
+        self.buckets = tuple(sorted(buckets))
+        # One slot per bucket plus +Inf, cumulated only when rendering
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def observe_many(self, values: Iterable[float]):
+        """Record several observations under a single lock acquisition"""
+        indexes = [(bisect.bisect_left(self.buckets, value), value) for value in values]
+        with self._lock:
+            for index, value in indexes:
+                self._counts[index] += 1
+                self._sum += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{_format_value(bound)}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {_format_value(total)}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+
+class Collector:
+    """Metric whose samples are read from existing state at scrape time"""
+
+    def __init__(self, name: str, help: str, type: str, collect: Callable[[], Iterable[Sample]]):
+        self.name = name
+        self.help = help
+        self.type = type
+        self._collect = collect
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}" for labels, value in self._collect()]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, buckets))
+
+    def gauge_func(self, name: str, help: str, collect: Callable[[], Iterable[Sample]]) -> Collector:
+        return self._register(Collector(name, help, "gauge", collect))
+
+    def counter_func(self, name: str, help: str, collect: Callable[[], Iterable[Sample]]) -> Collector:
+        return self._register(Collector(name, help, "counter", collect))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                samples = metric.render()
+            except Exception as e:
+                print(f"Error collecting metric {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+def value(amount: Optional[float], labels: Optional[Labels] = None) -> List[Sample]:
+    """Single-sample result for a collector, none when the value is unknown"""
+    return [] if amount is None else [(labels or {}, amount)]
+
+
+# Singleton instance
+registry = MetricsRegistry()
+
+# Hot-path histograms, recorded where the work happens
+MQTT_DISPATCH_WAIT = registry.histogram(
+    "cesiot_mqtt_dispatch_wait_seconds",
+    "Time MQTT messages wait in the dispatch queue before their handlers run"
+)
+INGEST_TO_STORAGE = registry.histogram(
+    "cesiot_ingest_to_influx_seconds",
+    "Time from a reading being received over MQTT to its batch being written to InfluxDB"
+)
+INFLUX_WRITE_DURATION = registry.histogram(
+    "cesiot_influx_write_duration_seconds",
+    "Duration of InfluxDB batch writes"
+)
+INFLUX_QUERY_DURATION = registry.histogram(
+    "cesiot_influx_query_duration_seconds",
+    "Duration of Flux queries, including time queued for the query pool"
+)
+WS_SEND_LAG = registry.histogram(
+    "cesiot_ws_send_lag_seconds",
+    "Time WebSocket frames spend in a client's send queue"
+)
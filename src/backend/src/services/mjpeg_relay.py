@@ -0,0 +1,257 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger("camera")
+
+SOI = b"\xff\xd8"
+EOI = b"\xff\xd9"
+# Guard against an upstream that never completes a part
+MAX_BUFFER_BYTES = 8 * 1024 * 1024
+RECONNECT_DELAY = 1.0
+# Period over which the upstream throughput is measured
+RATE_WINDOW = 1.0
+OUTPUT_BOUNDARY = "frame"
+
+
+class MJPEGFrame:
+    __slots__ = ("jpeg", "headers", "version", "ts")
+
+    def __init__(self, jpeg: bytes, headers: Dict[str, str], version: int, ts: float):
+        self.jpeg = jpeg
+        self.headers = headers
+        self.version = version
+        self.ts = ts
+
+
+class MJPEGParser:
+    """
+    Incremental multipart/x-mixed-replace parser yielding whole JPEG frames.
+    Parts are read by Content-Length when the upstream sends it,
+    otherwise by scanning for the JPEG start/end markers.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, chunk: bytes) -> List[Tuple[Dict[str, str], bytes]]:
+        self._buffer += chunk
+        frames = []
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                break
+            frames.append(frame)
+        if len(self._buffer) > MAX_BUFFER_BYTES:
+            self._buffer.clear()
+        return frames
+
+    def _next_frame(self) -> Optional[Tuple[Dict[str, str], bytes]]:
+        buffer = self._buffer
+        start = buffer.find(b"--")
+        if start < 0:
+            return None
+        header_end = buffer.find(b"\r\n\r\n", start)
+        if header_end < 0:
+            return None
+        headers = self._parse_headers(bytes(buffer[start:header_end]))
+        body_start = header_end + 4
+
+        length = headers.get("content-length")
+        if length is not None and length.isdigit():
+            body_end = body_start + int(length)
+            if len(buffer) < body_end:
+                return None
+            jpeg = bytes(buffer[body_start:body_end])
+            del buffer[:body_end]
+            return headers, jpeg
+
+        soi = buffer.find(SOI, body_start)
+        if soi < 0:
+            return None
+        eoi = buffer.find(EOI, soi + 2)
+        if eoi < 0:
+            return None
+        jpeg = bytes(buffer[soi:eoi + 2])
+        del buffer[:eoi + 2]
+        return headers, jpeg
+
+    @staticmethod
+    def _parse_headers(block: bytes) -> Dict[str, str]:
+        headers = {}
+        # First line is the boundary itself
+        for line in block.split(b"\r\n")[1:]:
+            name, sep, value = line.partition(b":")
+            if sep:
+                headers[name.strip().lower().decode("latin-1")] = value.strip().decode("latin-1")
+        return headers
+
+
+class MJPEGRelay:
+    """
+    One upstream MJPEG connection shared by every viewer of a URL.
+    Frames land in a single latest-frame slot: a viewer slower than the
+    upstream skips to the newest frame instead of buffering older ones.
+    The upstream is closed idle_timeout seconds after the last viewer left.
+    Must only be used from the event loop thread.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        client: httpx.AsyncClient,
+        idle_timeout: float,
+        on_stopped: Callable[["MJPEGRelay"], None]
+    ):
+        self.url = url
+        self.client = client
+        self.idle_timeout = idle_timeout
+        self._on_stopped = on_stopped
+        self.frame: Optional[MJPEGFrame] = None
+        self.viewers = 0
+        self.connected = False
+        self.bytes_per_s = 0.0
+        self.stats = {
+            "frames": 0,
+            "bytes_in": 0,
+            "reconnects": 0,
+        }
+        self._new_frame = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._idle_handle: Optional[asyncio.TimerHandle] = None
+
+    async def wait_frame(self, timeout: float) -> Optional[MJPEGFrame]:
+        """Latest frame, waiting up to timeout seconds for the first one"""
+        self._ensure_running()
+        if self.frame is None:
+            event = self._new_frame
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._schedule_idle_stop()
+        return self.frame
+
+    async def frames(self) -> AsyncIterator[MJPEGFrame]:
+        """Yield each newer frame as it arrives, skipping those missed while the viewer was busy"""
+        self.viewers += 1
+        self._ensure_running()
+        last_version = -1
+        try:
+            while True:
+                frame = self.frame
+                if frame is None or frame.version == last_version:
+                    await self._new_frame.wait()
+                    continue
+                last_version = frame.version
+                yield frame
+        finally:
+            self.viewers -= 1
+            self._schedule_idle_stop()
+
+    def stop(self):
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.connected = False
+        self._on_stopped(self)
+
+    def snapshot(self) -> Dict[str, object]:
+        frame = self.frame
+        return {
+            **self.stats,
+            "url": self.url,
+            "viewers": self.viewers,
+            "connected": self.connected,
+            "bytes_per_s": round(self.bytes_per_s),
+            "frame_age_s": round(time.time() - frame.ts, 3) if frame else None,
+        }
+
+    def _ensure_running(self):
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def _schedule_idle_stop(self):
+        if self.viewers > 0 or self._task is None or self._idle_handle is not None:
+            return
+        self._idle_handle = asyncio.get_running_loop().call_later(self.idle_timeout, self._stop_if_idle)
+
+    def _stop_if_idle(self):
+        self._idle_handle = None
+        if self.viewers == 0:
+            logger.warning("[RELAY] Last viewer left, closing upstream url=%s", self.url)
+            self.stop()
+
+    def _publish(self, headers: Dict[str, str], jpeg: bytes):
+        version = self.frame.version + 1 if self.frame else 0
+        self.frame = MJPEGFrame(jpeg, headers, version, time.time())
+        self.stats["frames"] += 1
+        # Wake every waiting viewer, later waiters get a fresh event
+        event, self._new_frame = self._new_frame, asyncio.Event()
+        event.set()
+
+    async def _run(self):
+        first = True
+        while True:
+            if not first:
+                self.stats["reconnects"] += 1
+                await asyncio.sleep(RECONNECT_DELAY)
+            first = False
+            try:
+                await self._relay_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("[RELAY] Upstream error url=%s err=%s", self.url, repr(e))
+            finally:
+                self.connected = False
+
+    async def _relay_once(self):
+        logger.warning("[RELAY] Connecting to: %s", self.url)
+        request = self.client.build_request(
+            "GET",
+            self.url,
+            headers={"Accept": "multipart/x-mixed-replace"},
+            timeout=httpx.Timeout(10.0, read=30.0),
+        )
+        upstream = await self.client.send(request, stream=True)
+        try:
+            if upstream.status_code != 200:
+                logger.error("[RELAY] Upstream returned %s url=%s", upstream.status_code, self.url)
+                return
+            self.connected = True
+            parser = MJPEGParser()
+            window_start = time.monotonic()
+            window_bytes = 0
+            async for chunk in upstream.aiter_raw():
+                self.stats["bytes_in"] += len(chunk)
+                window_bytes += len(chunk)
+                now = time.monotonic()
+                if now - window_start >= RATE_WINDOW:
+                    self.bytes_per_s = window_bytes / (now - window_start)
+                    window_start = now
+                    window_bytes = 0
+                for headers, jpeg in parser.feed(chunk):
+                    self._publish(headers, jpeg)
+        finally:
+            self.bytes_per_s = 0.0
+            await upstream.aclose()
+
+
+def multipart_part(frame: MJPEGFrame) -> bytes:
+    """One multipart part of the relayed stream, see OUTPUT_BOUNDARY"""
+    return (
+        f"--{OUTPUT_BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(frame.jpeg)}\r\n\r\n".encode()
+        + frame.jpeg
+        + b"\r\n"
+    )
@@ -0,0 +1,90 @@
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from services.metrics import MQTT_DISPATCH_WAIT
+
+# Sentinel pushed on a worker queue to stop it
+_STOP = object()
+
+
+class MessageDispatcher:
+    """
+    Bounded worker pool running MQTT message handlers off the paho thread.
+    Each topic is pinned to one worker, so messages of a topic keep their order.
+    The handler gets the monotonic time the message was received at.
+    """
+
+    def __init__(self, handler: Callable[[str, bytes, float], None], workers: int = 4, queue_size: int = 10000):
+        self._handler = handler
+        self._queues: List[queue.Queue] = [
+            queue.Queue(maxsize=max(1, queue_size)) for _ in range(max(1, workers))
+        ]
+        self._threads: List[threading.Thread] = []
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "dispatched": 0,
+            "dropped": 0,
+            "errors": 0,
+        }
+
+    def start(self):
+        """Start the worker threads"""
+        if self._threads:
+            return
+
+        for index, worker_queue in enumerate(self._queues):
+            thread = threading.Thread(
+                target=self._run,
+                args=(worker_queue,),
+                name=f"mqtt-dispatch-{index}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, topic: str, payload: bytes) -> bool:
+        """Enqueue a message without blocking, dropping it if its worker is saturated"""
+        worker_queue = self._queues[hash(topic) % len(self._queues)]
+        try:
+            worker_queue.put_nowait((topic, payload, time.monotonic()))
+        except queue.Full:
+            self._count("dropped")
+            return False
+        return True
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        """Let the workers drain their queues, then stop them"""
+        for worker_queue in self._queues:
+            worker_queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def stats(self) -> Dict[str, int]:
+        """Dispatch counters and current queue depth"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["pending"] = sum(q.qsize() for q in self._queues)
+        stats["workers"] = len(self._queues)
+        return stats
+
+    def _run(self, worker_queue: queue.Queue):
+        while True:
+            item = worker_queue.get()
+            if item is _STOP:
+                return
+
+            topic, payload, submitted = item
+            MQTT_DISPATCH_WAIT.observe(time.monotonic() - submitted)
+            try:
+                self._handler(topic, payload, submitted)
+                self._count("dispatched")
+            except Exception as e:
+                self._count("errors")
+                print(f"Error dispatching MQTT message on {topic}: {e}")
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self._stats[key] += 1
@@ -2,6 +2,9 @@ import paho.mqtt.client as mqtt
 import json
 from typing import Callable, List, Dict, Any, Optional
 from config.env import settings
+from services.ingestion import loads
+from services.mqtt_dispatcher import MessageDispatcher
+from services.topic_router import TopicRouter
 
 
 class Subscription:
@@ -15,7 +18,13 @@ class MQTTService:
         self.client: Optional[mqtt.Client] = None
         self.callbacks: List[Callable] = []
         self.subscriptions: List[Subscription] = []
+        self.router = TopicRouter()
         self.connected = False
+        self.dispatcher = MessageDispatcher(
+            self._dispatch,
+            workers=settings.mqtt.dispatch_workers,
+            queue_size=settings.mqtt.dispatch_queue_size
+        )
 
     def connect(self):
         """Connect to MQTT broker"""
@@ -34,6 +43,8 @@ class MQTTService:
         broker_url = settings.mqtt.host
         port = settings.mqtt.port
 
+        self.dispatcher.start()
+
         try:
             self.client.connect(broker_url, port, 60)
             self.client.loop_start()
@@ -55,19 +66,28 @@ class MQTTService:
             print(f"MQTT connection failed with code {reason_code}")
 
     def _on_message(self, client, userdata, msg):
-        """Callback when message is received"""
-        topic = msg.topic
-        raw_message = msg.payload.decode('utf-8')
-        payload = None
+        """Callback when message is received, runs on the paho network thread"""
+        if not self.dispatcher.submit(msg.topic, msg.payload) and settings.debug:
+            print(f"MQTT dispatch queue full, dropping message on {msg.topic}")
 
+    def _dispatch(self, topic: str, raw_payload: bytes, received_at: float):
+        """Parse a message once and run its handlers, on a dispatcher worker"""
         try:
-            payload = json.loads(raw_message)
+            payload = loads(raw_payload)
             if settings.debug:
                 print(f"MQTT message on {topic}: {payload}")
-        except json.JSONDecodeError as e:
+        except ValueError as e:
             print(f"Error parsing MQTT message: {e}")
             return
 
+        # Notify matching topic handlers first, one returning False drops the message (duplicate reading)
+        for sub in self.router.match(topic):
+            try:
+                if sub.handler(topic, payload, raw_payload, received_at) is False:
+                    return
+            except Exception as e:
+                print(f"Error in MQTT subscription handler: {e}")
+
         # Notify all registered callbacks
         for callback in self.callbacks:
             try:
@@ -75,29 +95,37 @@ class MQTTService:
             except Exception as e:
                 print(f"Error in MQTT callback: {e}")
 
-        # Notify matching topic handlers
-        for sub in self.subscriptions:
-            if self._matches_topic(sub.filter, topic):
-                try:
-                    sub.handler(topic, payload, raw_message)
-                except Exception as e:
-                    print(f"Error in MQTT subscription handler: {e}")
-
     def _on_disconnect(self, client, userdata, reason_code, properties=None, *_args):
         """Callback when disconnected from MQTT broker"""
         self.connected = False
         print(f"MQTT client disconnected (code: {reason_code})")
 
     def subscribe(self, filter: str, handler: Optional[Callable] = None):
-        """Subscribe to MQTT topic with optional handler"""
-        handler = handler or (lambda topic, payload, raw: None)
+        """
+        Subscribe to MQTT topic with optional handler(topic, payload, raw, received_at).
+        A handler returning False keeps the message from the callbacks registered with on_message.
+        """
+        handler = handler or (lambda topic, payload, raw, received_at: None)
         sub = Subscription(filter, handler)
         self.subscriptions.append(sub)
+        self.router.add(filter, sub)
 
         if self.client and self.connected:
             self.client.subscribe(filter)
             print(f"✓ Subscribed to {filter}")
 
+    def unsubscribe(self, filter: str, handler: Optional[Callable] = None):
+        """Remove handlers of a topic filter, unsubscribing from the broker when none is left"""
+        for sub in list(self.subscriptions):
+            if sub.filter == filter and (handler is None or sub.handler is handler):
+                self.subscriptions.remove(sub)
+                self.router.remove(filter, sub)
+
+        still_used = any(sub.filter == filter for sub in self.subscriptions)
+        if not still_used and self.client and self.connected:
+            self.client.unsubscribe(filter)
+            print(f"✓ Unsubscribed from {filter}")
+
     def subscribe_telemetry(self, handler: Callable):
         """Subscribe specifically to telemetry topics"""
         self.subscribe("sensors/+/telemetry", handler)
@@ -122,10 +150,11 @@ class MQTTService:
             self.client.loop_stop()
             self.client.disconnect()
             print("MQTT client disconnected")
+        self.dispatcher.stop()
 
     @staticmethod
     def _matches_topic(filter: str, topic: str) -> bool:
-        """Check if topic matches MQTT filter pattern"""
+        """Check if topic matches MQTT filter pattern (reference for the topic router)"""
         filter_levels = filter.split("/")
         topic_levels = topic.split("/")
 
@@ -0,0 +1,154 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from config.env import settings
+from services.downsampling import is_duration, parse_duration
+
+# Rough memory cost of one history row (dict of ~15 keys with datetimes and strings)
+ROW_BYTES_ESTIMATE = 800
+# Rough memory cost of one point of a columnar series (an int and a float in two lists)
+POINT_BYTES_ESTIMATE = 60
+
+
+def _estimate_size(rows: List[Dict[str, Any]]) -> int:
+    """Columnar series carry their points in a "t" array, other rows are one point each"""
+    size = 0
+    for row in rows:
+        points = row.get("t")
+        size += ROW_BYTES_ESTIMATE + (len(points) * POINT_BYTES_ESTIMATE if isinstance(points, list) else 0)
+    return max(size, ROW_BYTES_ESTIMATE)
+
+
+class _Entry:
+    __slots__ = ("rows", "size", "expires", "version")
+
+    def __init__(self, rows: List[Dict[str, Any]], size: int, expires: float, version: Any):
+        self.rows = rows
+        self.size = size
+        self.expires = expires
+        self.version = version
+
+
+class _InFlight:
+    __slots__ = ("task", "waiters", "version")
+
+    def __init__(self, task: asyncio.Future, version: Any):
+        self.task = task
+        self.waiters = 0
+        self.version = version
+
+
+class QueryCache:
+    """
+    LRU cache of history query results under a memory budget.
+    Identical concurrent queries share one in-flight load.
+    Must only be used from the event loop thread.
+    """
+
+    def __init__(self, max_bytes: int, min_ttl: float, max_ttl: float):
+        self.max_bytes = max_bytes
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._inflight: Dict[Hashable, _InFlight] = {}
+        self._bytes = 0
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+        }
+
+    def ttl_for(self, range_time: str) -> float:
+        """Longer ranges change proportionally less per second, so they live longer"""
+        if not is_duration(range_time):
+            return self.min_ttl
+        return min(self.max_ttl, max(self.min_ttl, parse_duration(range_time) / 1440))
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        ttl: float,
+        loader: Callable[[], Awaitable[List[Dict[str, Any]]]],
+        version: Any = None
+    ) -> Tuple[List[Dict[str, Any]], Any]:
+        """
+        Return cached rows, joining an identical in-flight query or starting one.
+        `version` is the caller's data version read before the query, it is
+        stored with the rows it describes and returned alongside them.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry.rows, entry.version
+            self._drop(key)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._stats["coalesced"] += 1
+        else:
+            self._stats["misses"] += 1
+            inflight = _InFlight(asyncio.ensure_future(loader()), version)
+            self._inflight[key] = inflight
+            inflight.task.add_done_callback(lambda task: self._on_loaded(key, ttl, inflight))
+
+        inflight.waiters += 1
+        try:
+            return await asyncio.shield(inflight.task), inflight.version
+        finally:
+            inflight.waiters -= 1
+            # The last waiter leaving cancels the shared query
+            if inflight.waiters == 0 and not inflight.task.done():
+                inflight.task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and memory usage"""
+        return {
+            **self._stats,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "inflight": len(self._inflight),
+        }
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def _on_loaded(self, key: Hashable, ttl: float, inflight: _InFlight):
+        task = inflight.task
+        if self._inflight.get(key) is inflight:
+            del self._inflight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+
+        rows = task.result()
+        size = _estimate_size(rows)
+        if size > self.max_bytes:
+            return
+
+        self._drop(key)
+        self._entries[key] = _Entry(rows, size, time.monotonic() + ttl, inflight.version)
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self._stats["evictions"] += 1
+
+    def _drop(self, key: Hashable) -> Optional[_Entry]:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+        return entry
+
+
+# Singleton instance
+query_cache = QueryCache(
+    max_bytes=settings.query_cache.max_mb * 1024 * 1024,
+    min_ttl=settings.query_cache.min_ttl_s,
+    max_ttl=settings.query_cache.max_ttl_s
+)
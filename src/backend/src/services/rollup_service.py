@@ -0,0 +1,106 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from config.env import settings
+from services.downsampling import Rollup, parse_duration
+from services.influx_service import influx_service
+
+# Raw span aggregated per Flux query, bounds the cost of a backfill step
+CHUNK_SECONDS = 6 * 3600
+
+
+def _truncate(value: datetime, seconds: int) -> datetime:
+    """Start of the epoch-aligned window of `seconds` containing value"""
+    timestamp = int(value.timestamp())
+    return datetime.fromtimestamp(timestamp - timestamp % seconds, tz=timezone.utc)
+
+
+class RollupService:
+    """
+    Maintains the {bucket}_{every} rollup buckets from the raw bucket.
+    Each pass aggregates the windows closed for at least `lateness` seconds, chunk by chunk,
+    and saves how far it got in the rollup bucket itself so a restart resumes there.
+    Windows holding points still in the spool wait for their replay.
+    A new rollup is first backfilled over `backfill`, history queries only read it once caught up.
+    Must only be used from the event loop thread.
+    """
+
+    def __init__(self, resolutions: List[str], interval: float, lateness: float, backfill: str):
+        self.rollups = [Rollup(every, f"{settings.influx.bucket}_{every}") for every in resolutions]
+        self.interval = interval
+        self.lateness = lateness
+        self.backfill = parse_duration(backfill)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None and self.rollups:
+            influx_service.rollups = self.rollups
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Rollup error: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self):
+        """Bring every rollup up to date"""
+        for rollup in self.rollups:
+            if rollup.done_until is None:
+                await self._provision(rollup)
+            await self._catch_up(rollup)
+
+    async def _provision(self, rollup: Rollup):
+        await influx_service.ensure_bucket(rollup.bucket)
+        state = await influx_service.rollup_state(rollup)
+        if state is None:
+            start = _truncate(datetime.now(timezone.utc) - timedelta(seconds=self.backfill), rollup.seconds)
+            state = (start, start)
+            print(f"Backfilling rollup {rollup.bucket} from {start.isoformat()}")
+        rollup.covers_from, rollup.done_until = state
+
+    async def _catch_up(self, rollup: Rollup):
+        target = _truncate(datetime.now(timezone.utc) - timedelta(seconds=self.lateness), rollup.seconds)
+        pending = await influx_service.spool_oldest_pending()
+        if pending is not None:
+            target = min(target, _truncate(pending, rollup.seconds))
+        chunk = timedelta(seconds=max(1, CHUNK_SECONDS // rollup.seconds) * rollup.seconds)
+        while rollup.done_until < target:
+            stop = min(rollup.done_until + chunk, target)
+            await influx_service.aggregate_rollup(rollup, rollup.done_until, stop)
+            await influx_service.save_rollup_state(rollup, rollup.covers_from, stop)
+            rollup.done_until = stop
+        if not rollup.ready:
+            rollup.ready = True
+            print(f"✓ Rollup {rollup.bucket} up to date")
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = datetime.now(timezone.utc)
+        return [
+            {
+                "bucket": rollup.bucket,
+                "every": rollup.every,
+                "ready": rollup.ready,
+                "covers_from": rollup.covers_from.isoformat() if rollup.covers_from else None,
+                "done_until": rollup.done_until.isoformat() if rollup.done_until else None,
+                "lag_s": round((now - rollup.done_until).total_seconds()) if rollup.done_until else None,
+            }
+            for rollup in self.rollups
+        ]
+
+
+# Singleton instance
+rollup_service = RollupService(
+    resolutions=[every.strip() for every in settings.rollup.resolutions.split(",") if every.strip()],
+    interval=settings.rollup.interval_s,
+    lateness=settings.rollup.lateness_s,
+    backfill=settings.rollup.backfill
+)
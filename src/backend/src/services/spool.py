@@ -0,0 +1,198 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+SEGMENT_SUFFIX = ".lp"
+# Bytes read from a segment per read() call at most, beyond what max_lines needs
+READ_CHUNK_BYTES = 1024 * 1024
+
+# Segment number, offset after the lines read, and how many lines they were
+Cursor = Tuple[int, int, int]
+
+
+class _Segment:
+    __slots__ = ("number", "path", "size", "lines", "read_offset", "read_lines")
+
+    def __init__(self, number: int, path: str, size: int = 0, lines: int = 0):
+        self.number = number
+        self.path = path
+        self.size = size
+        self.lines = lines
+        self.read_offset = 0
+        self.read_lines = 0
+
+
+class Spool:
+    """
+    Append-only on-disk queue of line-protocol points, split into numbered segment files.
+    Appends reach the OS at once and are fsynced at most every fsync_interval seconds.
+    Past max_bytes the oldest segments are dropped, so a long outage costs the oldest
+    points instead of the disk or the ingestion.
+    Reading is at-least-once: the read position only lives in memory, after a restart
+    the oldest segment is replayed from its start (rewriting a point is harmless).
+    Thread-safe.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int, max_bytes: int, fsync_interval: float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = min(segment_bytes, max_bytes)
+        self.fsync_interval = fsync_interval
+        self._segments: "OrderedDict[int, _Segment]" = OrderedDict()
+        self._active: Optional[_Segment] = None
+        self._next_number = 0
+        self._file = None
+        self._dirty = False
+        self._last_sync = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats = {
+            "appended": 0,
+            "replayed": 0,
+            "dropped": 0,
+        }
+
+        os.makedirs(directory, exist_ok=True)
+        for name in sorted(os.listdir(directory)):
+            number, suffix = os.path.splitext(name)
+            if suffix == SEGMENT_SUFFIX and number.isdigit():
+                path = os.path.join(directory, name)
+                with open(path, "rb") as segment_file:
+                    lines = sum(chunk.count(b"\n") for chunk in iter(lambda: segment_file.read(READ_CHUNK_BYTES), b""))
+                self._segments[int(number)] = _Segment(int(number), path, os.path.getsize(path), lines)
+                self._next_number = int(number) + 1
+
+    def append(self, lines: List[str]):
+        """Add points to the newest segment, starting a new one when it is full"""
+        if not lines:
+            return
+        data = ("\n".join(lines) + "\n").encode()
+        with self._lock:
+            if self._active is None or self._active.size >= self.segment_bytes:
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+            self._dirty = True
+            self._active.size += len(data)
+            self._active.lines += len(lines)
+            self._stats["appended"] += len(lines)
+            self._sync_if_due()
+            self._enforce_cap()
+
+    def read(self, max_lines: int) -> Tuple[List[str], Optional[Cursor]]:
+        """Oldest unread points, up to max_lines from one segment. Nothing is consumed until commit()"""
+        with self._lock:
+            while self._segments:
+                segment = next(iter(self._segments.values()))
+                lines, offset = self._read_segment(segment, max_lines)
+                if lines:
+                    return lines, (segment.number, offset, len(lines))
+                if segment is self._active:
+                    break
+                # Fully replayed, or only a torn last line is left
+                self._remove(segment)
+            return [], None
+
+    def commit(self, cursor: Cursor):
+        """Mark the points returned with this cursor as stored"""
+        number, offset, count = cursor
+        with self._lock:
+            segment = self._segments.get(number)
+            # Dropped by the size cap meanwhile
+            if segment is None or offset <= segment.read_offset:
+                return
+            segment.read_offset = offset
+            segment.read_lines += count
+            self._stats["replayed"] += count
+            if segment is not self._active and segment.read_offset >= segment.size:
+                self._remove(segment)
+
+    def oldest_pending_ms(self) -> Optional[int]:
+        """Timestamp (epoch ms) of the next point to replay, None when nothing is pending"""
+        with self._lock:
+            for segment in self._segments.values():
+                if segment.read_offset >= segment.size:
+                    continue
+                with open(segment.path, "rb") as segment_file:
+                    segment_file.seek(segment.read_offset)
+                    line = segment_file.readline()
+                # A torn last line is skipped by read() as well
+                if not line.endswith(b"\n"):
+                    continue
+                try:
+                    return int(line.rsplit(b" ", 1)[1])
+                except (IndexError, ValueError):
+                    return None
+            return None
+
+    def sync(self):
+        """fsync appended data when the interval has elapsed"""
+        with self._lock:
+            self._sync_if_due()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+                self._active = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Depth and replay progress"""
+        with self._lock:
+            return {
+                **self._stats,
+                "pending": sum(segment.lines - segment.read_lines for segment in self._segments.values()),
+                "bytes": sum(segment.size - segment.read_offset for segment in self._segments.values()),
+                "segments": len(self._segments),
+            }
+
+    def _read_segment(self, segment: _Segment, max_lines: int) -> Tuple[List[str], int]:
+        if segment.read_offset >= segment.size:
+            return [], segment.read_offset
+        with open(segment.path, "rb") as segment_file:
+            segment_file.seek(segment.read_offset)
+            data = segment_file.read(min(segment.size - segment.read_offset, READ_CHUNK_BYTES))
+        end = data.rfind(b"\n")
+        if end < 0:
+            return [], segment.read_offset
+        lines = data[:end].decode().split("\n")[:max_lines]
+        consumed = sum(len(line.encode()) + 1 for line in lines)
+        return lines, segment.read_offset + consumed
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._last_sync = time.monotonic()
+        number = self._next_number
+        self._next_number += 1
+        path = os.path.join(self.directory, f"{number:012d}{SEGMENT_SUFFIX}")
+        self._active = _Segment(number, path)
+        self._segments[number] = self._active
+        self._file = open(path, "ab")
+
+    def _sync_if_due(self):
+        if self._dirty and time.monotonic() - self._last_sync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._dirty = False
+            self._last_sync = time.monotonic()
+
+    def _enforce_cap(self):
+        total = sum(segment.size - segment.read_offset for segment in self._segments.values())
+        while total > self.max_bytes and len(self._segments) > 1:
+            oldest = next(iter(self._segments.values()))
+            total -= oldest.size - oldest.read_offset
+            self._stats["dropped"] += oldest.lines - oldest.read_lines
+            self._remove(oldest)
+
+    def _remove(self, segment: _Segment):
+        del self._segments[segment.number]
+        try:
+            os.remove(segment.path)
+        except FileNotFoundError:
+            pass
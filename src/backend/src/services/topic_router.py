@@ -0,0 +1,94 @@
+import threading
+from typing import Any, Dict, List
+
+
+class _Node:
+    __slots__ = ("children", "values")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.values: List[Any] = []
+
+
+class TopicRouter:
+    """
+    Trie of MQTT topic filters supporting `+` and `#` wildcards.
+    A single walk over the topic levels returns every value whose filter matches.
+    Mutations are serialized by a lock, lookups are lock-free.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._lock = threading.Lock()
+        self._size = 0
+
+    def add(self, filter: str, value: Any):
+        """Register a value under a topic filter"""
+        with self._lock:
+            node = self._root
+            for level in filter.split("/"):
+                child = node.children.get(level)
+                if child is None:
+                    child = _Node()
+                    node.children[level] = child
+                node = child
+            # Copy-on-write so concurrent lookups never see a half-updated list
+            node.values = node.values + [value]
+            self._size += 1
+
+    def remove(self, filter: str, value: Any) -> bool:
+        """Remove one registration of a value, pruning empty branches"""
+        with self._lock:
+            path = [self._root]
+            for level in filter.split("/"):
+                child = path[-1].children.get(level)
+                if child is None:
+                    return False
+                path.append(child)
+
+            node = path[-1]
+            for index, existing in enumerate(node.values):
+                if existing is value or existing == value:
+                    node.values = node.values[:index] + node.values[index + 1:]
+                    break
+            else:
+                return False
+            self._size -= 1
+
+            levels = filter.split("/")
+            for depth in range(len(levels), 0, -1):
+                node = path[depth]
+                if node.values or node.children:
+                    break
+                del path[depth - 1].children[levels[depth - 1]]
+            return True
+
+    def match(self, topic: str) -> List[Any]:
+        """Return the values of every filter matching a topic"""
+        levels = topic.split("/")
+        depth_max = len(levels)
+        matches: List[Any] = []
+        stack = [(self._root, 0)]
+
+        while stack:
+            node, depth = stack.pop()
+
+            multi = node.children.get("#")
+            if multi is not None:
+                matches.extend(multi.values)
+
+            if depth == depth_max:
+                matches.extend(node.values)
+                continue
+
+            exact = node.children.get(levels[depth])
+            if exact is not None:
+                stack.append((exact, depth + 1))
+            single = node.children.get("+")
+            if single is not None:
+                stack.append((single, depth + 1))
+
+        return matches
+
+    def __len__(self) -> int:
+        return self._size
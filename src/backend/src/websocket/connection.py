@@ -0,0 +1,136 @@
+from fastapi import WebSocket
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Set, Tuple, Union
+import asyncio
+import itertools
+import time
+from services.metrics import WS_SEND_LAG
+from websocket.encoding import TopicFrame, pack_topics
+
+OVERFLOW_POLICIES = ("drop_oldest", "conflate")
+
+
+class ClientConnection:
+    """
+    Bounded outbound queue of one WebSocket client, drained by its own writer task.
+    A slow client only delays itself: on overflow the oldest message is dropped,
+    and with the conflate policy a newer message for the same key replaces the queued one.
+    A client that stays behind longer than evict_after seconds is closed.
+    """
+
+    # Frames dropped on overflow by every connection since startup, only touched from the event loop
+    dropped_total = 0
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        max_queue: int,
+        policy: str,
+        evict_after: float,
+        on_close: Callable[[WebSocket], None],
+        encoding: str = "json"
+    ):
+        self.websocket = websocket
+        self.encoding = encoding
+        # Interned topic ids this client already received a definition for
+        self.known_topics: Set[int] = set()
+        self.max_queue = max(1, max_queue)
+        self.conflate = policy == "conflate"
+        self.evict_after = evict_after
+        self._on_close = on_close
+        # Frames with the time they were queued, for the send lag metric
+        self._pending: "OrderedDict[Hashable, Tuple[Union[str, bytes, TopicFrame], float]]" = OrderedDict()
+        self._ids = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._behind_since: Optional[float] = None
+        self._closed = False
+        self.evicted = False
+        self.stats = {
+            "sent": 0,
+            "dropped": 0,
+            "conflated": 0,
+        }
+        self._task = asyncio.get_running_loop().create_task(self._writer())
+
+    def enqueue(self, message: Union[str, bytes, TopicFrame], key: Optional[Hashable] = None):
+        """Queue a frame without waiting, applying the overflow policy"""
+        if self._closed:
+            return
+
+        if key is not None and self.conflate and key in self._pending:
+            # Keep the queue position, only the newest value is worth sending
+            self._pending[key] = (message, self._pending[key][1])
+            self.stats["conflated"] += 1
+            return
+
+        if len(self._pending) >= self.max_queue:
+            self._pending.popitem(last=False)
+            self.stats["dropped"] += 1
+            ClientConnection.dropped_total += 1
+            now = time.monotonic()
+            if self._behind_since is None:
+                self._behind_since = now
+            elif now - self._behind_since > self.evict_after:
+                print(f"Evicting slow WebSocket client (behind for {now - self._behind_since:.1f}s)")
+                self.evicted = True
+                self.close(code=1013)
+                return
+
+        if key is None or not self.conflate:
+            key = next(self._ids)
+        self._pending[key] = (message, time.monotonic())
+        self._wakeup.set()
+
+    def stop(self) -> bool:
+        """Stop the writer and drop queued frames, False if already stopped"""
+        if self._closed:
+            return False
+        self._closed = True
+        self._pending.clear()
+        self._task.cancel()
+        return True
+
+    def close(self, code: int = 1000):
+        """Stop the writer and close the socket"""
+        if not self.stop():
+            return
+        self._on_close(self.websocket)
+        asyncio.get_running_loop().create_task(self._close_socket(code))
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def _writer(self):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self._pending:
+                    _, (message, queued_at) = self._pending.popitem(last=False)
+                    if isinstance(message, TopicFrame):
+                        # Definitions are sent right before first use, so they can never be dropped alone
+                        unknown = [[i, t] for i, t in message.topics.items() if i not in self.known_topics]
+                        if unknown:
+                            await self.websocket.send_bytes(pack_topics(unknown))
+                            self.known_topics.update(i for i, _ in unknown)
+                        message = message.payload
+                    if isinstance(message, bytes):
+                        await self.websocket.send_bytes(message)
+                    else:
+                        await self.websocket.send_text(message)
+                    self.stats["sent"] += 1
+                    WS_SEND_LAG.observe(time.monotonic() - queued_at)
+                # Fully drained, the client has caught up
+                self._behind_since = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error sending to client: {e}")
+            if self.stop():
+                self._on_close(self.websocket)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "pending": len(self._pending)}
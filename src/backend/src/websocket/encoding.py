@@ -0,0 +1,53 @@
+"""
+Frame encodings of the /ws channel.
+
+json (default): text frames, as before.
+msgpack: binary frames, negotiated with ?encoding=msgpack or the
+"cesiot.msgpack" subprotocol. Control messages keep their JSON shape
+as msgpack maps; sensor data uses compact arrays with integer
+timestamps (epoch ms) and interned topic ids:
+  [0, [[topic_id, topic], ...]]          topic definitions, sent once per client before first use
+  [1, topic_id, ts_ms, payload]          one sensor update
+  [2, ts_ms, [[topic_id, payload], ...]] batch of updates (WS_BATCH_INTERVAL_MS mode)
+"""
+
+from typing import Any, Dict, Iterable, List
+import msgpack
+
+ENCODINGS = ("json", "msgpack")
+SUBPROTOCOLS = {"cesiot.msgpack": "msgpack", "cesiot.json": "json"}
+
+FRAME_TOPICS = 0
+FRAME_DATA = 1
+FRAME_BATCH = 2
+
+
+class TopicFrame:
+    """Binary frame referencing interned topic ids the client may not know yet"""
+
+    __slots__ = ("payload", "topics")
+
+    def __init__(self, payload: bytes, topics: Dict[int, str]):
+        self.payload = payload
+        self.topics = topics
+
+
+def pack(value: Any) -> bytes:
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def pack_topics(topics: Iterable[List[Any]]) -> bytes:
+    return pack([FRAME_TOPICS, list(topics)])
+
+
+def pack_batch(ts_ms: int, items: List[bytes]) -> bytes:
+    """Batch frame from already packed [topic_id, payload] items, without re-encoding them"""
+    return b"\x93" + pack(FRAME_BATCH) + pack(ts_ms) + _array_header(len(items)) + b"".join(items)
+
+
+def _array_header(length: int) -> bytes:
+    if length < 16:
+        return bytes([0x90 | length])
+    if length < 0x10000:
+        return b"\xdc" + length.to_bytes(2, "big")
+    return b"\xdd" + length.to_bytes(4, "big")
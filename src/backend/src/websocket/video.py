@@ -0,0 +1,125 @@
+"""
+Binary video channel (/api/camera/ws/{filter}), alternative to the MJPEG streams.
+
+Each frame is one binary message: a little-endian header followed by the JPEG.
+  u8  protocol version (VIDEO_PROTOCOL)
+  u32 frame version (hub frame counter)
+  u64 timestamp, epoch ms of the camera frame
+  u16 number of face boxes
+  n x (u16 x, u16 y, u16 w, u16 h) face boxes, in frame pixels
+  JPEG bytes
+
+Flow control is credit based: the client starts with ?credits=N (default 2)
+and each frame sent consumes one. Text messages {"type": "ack"} give one
+credit back, {"type": "ack", "credits": k} give k. Without credits the
+server waits, and only the latest frame is sent when credits come back.
+"""
+
+from fastapi import WebSocket, WebSocketDisconnect
+from typing import List, Tuple
+from datetime import datetime
+import asyncio
+import json
+import struct
+from services.mjpeg_relay import MJPEGFrame, MJPEGRelay
+
+VIDEO_PROTOCOL = 1
+VIDEO_HEADER = struct.Struct("<BIQH")
+FACE_BOX = struct.Struct("<HHHH")
+MAX_CREDITS = 30
+UINT16_MAX = 0xFFFF
+
+
+def parse_faces(value: str) -> List[Tuple[int, int, int, int]]:
+    """Face boxes from an X-Faces part header ("x,y,w,h;x,y,w,h")"""
+    faces = []
+    for box in value.split(";"):
+        parts = box.split(",")
+        if len(parts) != 4:
+            continue
+        try:
+            faces.append(tuple(min(UINT16_MAX, max(0, int(p))) for p in parts))
+        except ValueError:
+            continue
+    return faces
+
+
+def pack_video_frame(frame: MJPEGFrame) -> bytes:
+    """Header and JPEG of one relayed frame, metadata taken from the hub part headers"""
+    headers = frame.headers
+    try:
+        version = int(headers.get("x-frame-version", frame.version))
+    except ValueError:
+        version = frame.version
+    try:
+        ts_ms = int(headers.get("x-timestamp") or 0) or int(frame.ts * 1000)
+    except ValueError:
+        ts_ms = int(frame.ts * 1000)
+    faces = parse_faces(headers.get("x-faces", ""))
+    return b"".join((
+        VIDEO_HEADER.pack(VIDEO_PROTOCOL, version & 0xFFFFFFFF, ts_ms, len(faces)),
+        *(FACE_BOX.pack(*box) for box in faces),
+        frame.jpeg,
+    ))
+
+
+class VideoSession:
+    """One client of the video channel: a credit counter and a sender task reading the shared relay"""
+
+    def __init__(self, websocket: WebSocket, relay: MJPEGRelay, credits: int):
+        self.websocket = websocket
+        self.relay = relay
+        self.credits = min(MAX_CREDITS, max(1, credits))
+        self._credit = asyncio.Event()
+        self.sent = 0
+
+    async def run(self):
+        """Send frames while reading acks, until the client goes away"""
+        await self.websocket.send_json({
+            "type": "connection",
+            "protocol": VIDEO_PROTOCOL,
+            "credits": self.credits,
+            "timestamp": datetime.now().isoformat()
+        })
+        sender = asyncio.get_running_loop().create_task(self._send_frames())
+        try:
+            while True:
+                message = await self.websocket.receive_text()
+                self._handle(message)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            sender.cancel()
+
+    def _handle(self, message: str):
+        try:
+            data = json.loads(message)
+        except json.JSONDecodeError:
+            return
+        if not isinstance(data, dict) or data.get("type") != "ack":
+            return
+        granted = data.get("credits", 1)
+        if not isinstance(granted, int) or granted < 1:
+            return
+        self.credits = min(MAX_CREDITS, self.credits + granted)
+        self._credit.set()
+
+    async def _send_frames(self):
+        last_version = -1
+        try:
+            async for frame in self.relay.frames():
+                while self.credits <= 0:
+                    self._credit.clear()
+                    await self._credit.wait()
+                # Credits may have taken a while, send whatever is newest now
+                frame = self.relay.frame or frame
+                if frame.version == last_version:
+                    continue
+                last_version = frame.version
+                self.credits -= 1
+                await self.websocket.send_bytes(pack_video_frame(frame))
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error sending video frame: {e}")
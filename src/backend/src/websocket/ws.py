@@ -1,32 +1,97 @@
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import Set, Dict, Any
+from typing import Set, Dict, Any, List, Optional
 import json
 from datetime import datetime
 import asyncio
+import threading
+import time
+from config.env import settings
 from services.mqtt_service import mqtt_service
+from services.topic_router import TopicRouter
+from websocket.connection import ClientConnection, OVERFLOW_POLICIES
+from websocket.encoding import ENCODINGS, SUBPROTOCOLS, FRAME_DATA, TopicFrame, pack, pack_batch
+
+
+def is_valid_filter(filter: Any) -> bool:
+    """Check an MQTT topic filter: + and # must fill a whole level, # only last"""
+    if not isinstance(filter, str) or not filter:
+        return False
+    levels = filter.split("/")
+    for index, level in enumerate(levels):
+        if "#" in level and (level != "#" or index != len(levels) - 1):
+            return False
+        if "+" in level and level != "+":
+            return False
+    return True
+
+
+def update_key(topic: str, payload: Any):
+    """Identity of a sensor update: one per sensor and metric, the topic when the payload has no metric"""
+    if isinstance(payload, dict) and payload.get("metric") is not None:
+        return (topic, payload.get("sensor_id"), payload.get("metric"))
+    return topic
 
 
 class WebSocketManager:
     def __init__(self):
-        self.clients: Set[WebSocket] = set()
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        self.subscriptions: Dict[WebSocket, Set[str]] = {}
+        # Clients still on the default topics, replaced by their first explicit subscribe
+        self._implicit: Set[WebSocket] = set()
+        self.router = TopicRouter()
+        self.evicted = 0
         self._loop: asyncio.AbstractEventLoop | None = None
+        # Tick-based batching: latest (topic, payload) per sensor and metric, filled from MQTT dispatch threads
+        self._batch: Dict[Any, tuple] = {}
+        self._batch_lock = threading.Lock()
+        self._tick_task: Optional[asyncio.Task] = None
+        # Topics interned as small integers for binary encodings, shared by all clients
+        self._topic_ids: Dict[str, int] = {}
 
     async def connect(self, websocket: WebSocket):
-        """Accept new WebSocket connection"""
-        await websocket.accept()
-        self.clients.add(websocket)
-        print(f"✓ New WebSocket client connected (total: {len(self.clients)})")
+        """Accept new WebSocket connection, negotiating its encoding"""
+        encoding, subprotocol = self._negotiate(websocket)
+        await websocket.accept(subprotocol=subprotocol)
+        self.subscriptions[websocket] = set()
+        for filter in self._default_topics():
+            self._subscribe(websocket, filter)
+        self._implicit.add(websocket)
 
         # Send welcome message
-        await websocket.send_json({
+        welcome = {
             "type": "connection",
             "message": "Connected to IoT Backend WebSocket",
+            "encoding": encoding,
+            "topics": sorted(self.subscriptions[websocket]),
             "timestamp": datetime.now().isoformat()
-        })
+        }
+        if encoding == "msgpack":
+            await websocket.send_bytes(pack(welcome))
+        else:
+            await websocket.send_json(welcome)
+
+        # From now on every frame goes through the client's own queue and writer
+        policy = settings.ws.overflow_policy
+        self.clients[websocket] = ClientConnection(
+            websocket,
+            max_queue=settings.ws.queue_size,
+            policy=policy if policy in OVERFLOW_POLICIES else "drop_oldest",
+            evict_after=settings.ws.evict_after_s,
+            on_close=self._on_connection_closed,
+            encoding=encoding
+        )
+        print(f"✓ New WebSocket client connected (total: {len(self.clients)})")
 
     def disconnect(self, websocket: WebSocket):
-        """Remove WebSocket connection"""
-        self.clients.discard(websocket)
+        """Remove WebSocket connection and its subscriptions"""
+        self._implicit.discard(websocket)
+        for filter in self.subscriptions.pop(websocket, set()):
+            self.router.remove(filter, websocket)
+
+        connection = self.clients.pop(websocket, None)
+        if connection is None:
+            return
+        connection.stop()
         print(f"WebSocket client disconnected (remaining: {len(self.clients)})")
 
     async def handle_message(self, websocket: WebSocket, data: Dict[str, Any]):
@@ -34,60 +99,254 @@ class WebSocketManager:
         msg_type = data.get("type")
 
         if msg_type == "ping":
-            await websocket.send_json({
+            await self.send_json(websocket, {
                 "type": "pong",
                 "timestamp": datetime.now().isoformat()
             })
-        elif msg_type == "subscribe":
-            await websocket.send_json({
-                "type": "subscribed",
+        elif msg_type in ("subscribe", "unsubscribe"):
+            filters = self._requested_filters(data)
+            invalid = [f for f in filters if not is_valid_filter(f)]
+            if not filters or invalid:
+                await self.send_json(websocket, {
+                    "type": "error",
+                    "message": f"Invalid topic filter: {invalid[0] if invalid else None}",
+                    "timestamp": datetime.now().isoformat()
+                })
+                return
+
+            if msg_type == "subscribe":
+                if websocket in self._implicit:
+                    self._implicit.discard(websocket)
+                    for filter in list(self.subscriptions.get(websocket, set())):
+                        self._unsubscribe(websocket, filter)
+                for filter in filters:
+                    self._subscribe(websocket, filter)
+            else:
+                self._implicit.discard(websocket)
+                for filter in filters:
+                    self._unsubscribe(websocket, filter)
+
+            await self.send_json(websocket, {
+                "type": "subscribed" if msg_type == "subscribe" else "unsubscribed",
                 "topic": data.get("topic"),
+                "topics": sorted(self.subscriptions.get(websocket, set())),
                 "timestamp": datetime.now().isoformat()
             })
         else:
-            await websocket.send_json({
+            await self.send_json(websocket, {
                 "type": "error",
                 "message": "Unknown message type",
                 "timestamp": datetime.now().isoformat()
             })
 
+    async def send_json(self, websocket: WebSocket, data: Dict[str, Any]):
+        """Queue a control message for one client, in its encoding"""
+        connection = self.clients.get(websocket)
+        if connection:
+            connection.enqueue(pack(data) if connection.encoding == "msgpack" else json.dumps(data))
+
     async def broadcast(self, data: Dict[str, Any]):
         """Broadcast message to all connected clients"""
-        message = json.dumps(data)
-        disconnected = set()
+        encoded = {}
+        for connection in list(self.clients.values()):
+            if connection.encoding not in encoded:
+                encoded[connection.encoding] = pack(data) if connection.encoding == "msgpack" else json.dumps(data)
+            connection.enqueue(encoded[connection.encoding])
 
-        for client in self.clients:
-            try:
-                await client.send_text(message)
-            except Exception as e:
-                print(f"Error sending to client: {e}")
-                disconnected.add(client)
+    def publish(
+        self,
+        topic: str,
+        payload: Dict[str, Any],
+        clients: Optional[List[WebSocket]] = None,
+        received_at: Optional[float] = None
+    ):
+        """Queue a sensor update for the clients subscribed to its topic, without waiting on any of them"""
+        if clients is None:
+            clients = self.router.match(topic)
+        if not clients:
+            return
+        received_at = received_at or time.time()
+
+        # Serialized at most once per encoding, a client may match through several filters
+        encoded: Dict[str, Any] = {}
+        for websocket in dict.fromkeys(clients):
+            connection = self.clients.get(websocket)
+            if connection is None:
+                continue
+            message = encoded.get(connection.encoding)
+            if message is None:
+                message = self._encode_update(connection.encoding, topic, payload, received_at)
+                encoded[connection.encoding] = message
+            connection.enqueue(message, key=update_key(topic, payload))
+
+    def _encode_update(self, encoding: str, topic: str, payload: Dict[str, Any], received_at: float):
+        if encoding == "msgpack":
+            topic_id = self._topic_id(topic)
+            return TopicFrame(
+                pack([FRAME_DATA, topic_id, int(received_at * 1000), payload]),
+                {topic_id: topic}
+            )
+        return json.dumps({
+            "type": "sensor_data",
+            "topic": topic,
+            "data": payload,
+            "timestamp": datetime.fromtimestamp(received_at).isoformat()
+        })
+
+    def _topic_id(self, topic: str) -> int:
+        topic_id = self._topic_ids.get(topic)
+        if topic_id is None:
+            topic_id = len(self._topic_ids)
+            self._topic_ids[topic] = topic_id
+        return topic_id
+
+    @staticmethod
+    def _negotiate(websocket: WebSocket):
+        """Encoding from ?encoding= or a cesiot.* subprotocol, JSON by default"""
+        for offered in websocket.scope.get("subprotocols") or []:
+            if offered in SUBPROTOCOLS:
+                return SUBPROTOCOLS[offered], offered
+        encoding = websocket.query_params.get("encoding", "json")
+        return (encoding if encoding in ENCODINGS else "json"), None
+
+    def stats(self) -> Dict[str, Any]:
+        """Fan-out counters summed over connected clients"""
+        totals = {
+            "clients": len(self.clients),
+            "evicted": self.evicted,
+            "sent": 0,
+            "dropped": 0,
+            "conflated": 0,
+            "pending": 0,
+        }
+        for connection in self.clients.values():
+            for key, value in connection.snapshot().items():
+                totals[key] += value
+        return totals
+
+    def _on_connection_closed(self, websocket: WebSocket):
+        connection = self.clients.get(websocket)
+        if connection is not None and connection.evicted:
+            self.evicted += 1
+        self.disconnect(websocket)
+
+    def _subscribe(self, websocket: WebSocket, filter: str):
+        filters = self.subscriptions.setdefault(websocket, set())
+        if filter not in filters:
+            filters.add(filter)
+            self.router.add(filter, websocket)
 
-        # Remove disconnected clients
-        for client in disconnected:
-            self.clients.discard(client)
+    def _unsubscribe(self, websocket: WebSocket, filter: str):
+        filters = self.subscriptions.get(websocket)
+        if filters and filter in filters:
+            filters.discard(filter)
+            self.router.remove(filter, websocket)
+
+    @staticmethod
+    def _requested_filters(data: Dict[str, Any]) -> List[str]:
+        filters = data.get("topics")
+        if not isinstance(filters, list):
+            filters = [data.get("topic")]
+        return [f for f in filters if f is not None] or [None]
+
+    @staticmethod
+    def _default_topics() -> List[str]:
+        return [t.strip() for t in settings.ws.default_topics.split(",") if t.strip()]
 
     def initialize(self):
         """Initialize WebSocket manager and MQTT forwarding"""
         self._loop = asyncio.get_running_loop()
+        batch_interval = settings.ws.batch_interval_ms / 1000
 
-        # Forward MQTT messages to all WebSocket clients
+        # Forward MQTT messages to the WebSocket clients subscribed to their topic
         def mqtt_to_ws(topic: str, payload: Dict[str, Any]):
             if not self._loop:
                 return
-            self._loop.call_soon_threadsafe(
-                asyncio.create_task,
-                self.broadcast({
-                    "type": "sensor_data",
-                    "topic": topic,
-                    "data": payload,
-                    "timestamp": datetime.now().isoformat()
-                })
-            )
+            clients = self.router.match(topic)
+            if not clients:
+                return
+            if batch_interval > 0:
+                # Latest value per sensor and metric, sent with the next tick
+                with self._batch_lock:
+                    self._batch[update_key(topic, payload)] = (topic, payload)
+                return
+            self._loop.call_soon_threadsafe(self.publish, topic, payload, clients, time.time())
+
+        if batch_interval > 0:
+            self._tick_task = self._loop.create_task(self._run_ticks(batch_interval))
 
         mqtt_service.on_message(mqtt_to_ws)
         print("✓ WebSocket manager initialized")
 
+    def close(self):
+        """Stop the batching tick and every client writer"""
+        if self._tick_task:
+            self._tick_task.cancel()
+            self._tick_task = None
+        for connection in list(self.clients.values()):
+            connection.stop()
+
+    async def _run_ticks(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self._flush_batch()
+            except Exception as e:
+                print(f"Error flushing WebSocket batch: {e}")
+
+    def _flush_batch(self):
+        """Send the updates gathered since the last tick, one array frame per client"""
+        with self._batch_lock:
+            batch, self._batch = self._batch, {}
+        if not batch:
+            return
+
+        # Each update is serialized once per encoding, frames are joined from the encoded items
+        topics: List[str] = []
+        payloads: List[Dict[str, Any]] = []
+        json_items: List[Optional[str]] = []
+        packed_items: List[Optional[bytes]] = []
+        per_client: Dict[WebSocket, List[int]] = {}
+        for topic, payload in batch.values():
+            clients = self.router.match(topic)
+            if not clients:
+                continue
+            index = len(topics)
+            topics.append(topic)
+            payloads.append(payload)
+            json_items.append(None)
+            packed_items.append(None)
+            for websocket in clients:
+                indexes = per_client.setdefault(websocket, [])
+                if not indexes or indexes[-1] != index:
+                    indexes.append(index)
+
+        now = time.time()
+        prefix = '{"type":"sensor_batch","timestamp":' + json.dumps(datetime.fromtimestamp(now).isoformat()) + ',"items":['
+        frames: Dict[tuple, Any] = {}
+        for websocket, indexes in per_client.items():
+            connection = self.clients.get(websocket)
+            if connection is None:
+                continue
+            key = (connection.encoding, tuple(indexes))
+            frame = frames.get(key)
+            if frame is None:
+                if connection.encoding == "msgpack":
+                    for i in indexes:
+                        if packed_items[i] is None:
+                            packed_items[i] = pack([self._topic_id(topics[i]), payloads[i]])
+                    frame = TopicFrame(
+                        pack_batch(int(now * 1000), [packed_items[i] for i in indexes]),
+                        {self._topic_id(topics[i]): topics[i] for i in indexes}
+                    )
+                else:
+                    for i in indexes:
+                        if json_items[i] is None:
+                            json_items[i] = json.dumps({"topic": topics[i], "data": payloads[i]})
+                    frame = prefix + ",".join(json_items[i] for i in indexes) + "]}"
+                frames[key] = frame
+            connection.enqueue(frame)
+
 
 # Singleton instance
 ws_manager = WebSocketManager()
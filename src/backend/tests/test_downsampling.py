@@ -0,0 +1,21 @@
+import random
+
+import pytest
+
+from services.downsampling import parse_duration, window_for
+
+
+def _windows_touched(start: float, stop: float, every: float) -> int:
+    """Epoch-aligned aggregateWindow buckets holding points of [start, stop)"""
+    return int((stop - 1e-9) // every) - int(start // every) + 1
+
+
+@pytest.mark.parametrize("range_time", ["1h", "24h", "7d", "30d", "90m", "10s"])
+@pytest.mark.parametrize("max_points", [3, 10, 100, 500, 1000, 1440])
+def test_window_for_stays_within_max_points(range_time, max_points):
+    every = parse_duration(window_for(range_time, max_points))
+    span = parse_duration(range_time)
+    rng = random.Random(f"{range_time}-{max_points}")
+    for _ in range(200):
+        stop = 1_700_000_000 + rng.random() * 86400
+        assert _windows_touched(stop - span, stop, every) <= max_points
@@ -0,0 +1,85 @@
+"""
+Rollup history queries against a real InfluxDB 2.x, skipped unless TEST_INFLUX_URL is set
+(with TEST_INFLUX_TOKEN and TEST_INFLUX_ORG). Buckets are created and deleted by the test.
+"""
+
+import asyncio
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from influxdb_client import InfluxDBClient, Point, WritePrecision
+from influxdb_client.client.write_api import SYNCHRONOUS
+
+from config.env import settings
+from services.downsampling import Rollup
+from services.influx_service import InfluxService
+
+INFLUX_URL = os.environ.get("TEST_INFLUX_URL")
+
+pytestmark = pytest.mark.skipif(not INFLUX_URL, reason="needs TEST_INFLUX_URL pointing to an InfluxDB 2.x")
+
+
+def _window_means(rows):
+    return {row["time"]: row["value"] for row in rows}
+
+
+def test_mixed_rollup_query_matches_raw_across_done_until(monkeypatch):
+    bucket = f"test_{uuid.uuid4().hex[:8]}"
+    monkeypatch.setattr(settings.influx, "bucket", bucket)
+    monkeypatch.setattr(settings.influx, "org", os.environ.get("TEST_INFLUX_ORG", settings.influx.org))
+
+    service = InfluxService()
+    service.client = InfluxDBClient(url=INFLUX_URL, token=os.environ.get("TEST_INFLUX_TOKEN", ""), org=settings.influx.org)
+    service.query_api = service.client.query_api()
+    service._query_executor = ThreadPoolExecutor(max_workers=2)
+    rollup = Rollup("1m", f"{bucket}_1m")
+
+    # One point every 10 s over 2 h, a steadily rising value so any bias in a window shows
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    start = now - timedelta(hours=2)
+    points = [
+        Point("telemetry").tag("room", "C4").tag("sensor_id", "s0").tag("metric", "temperature")
+        .field("value", float(i)).time(int((start + timedelta(seconds=10 * i)).timestamp() * 1000), WritePrecision.MS)
+        for i in range(2 * 360)
+    ]
+    # Rollup aggregated up to the middle of a 10m query window
+    done_until = now - timedelta(minutes=35)
+    done_until -= timedelta(minutes=done_until.minute % 10 - 5)
+
+    async def run():
+        await service.ensure_bucket(bucket)
+        await service.ensure_bucket(rollup.bucket)
+        try:
+            service.write_api = service.client.write_api(write_options=SYNCHRONOUS)
+            service.write_api.write(bucket=bucket, org=settings.influx.org, record=points)
+            await service.aggregate_rollup(rollup, start, done_until)
+            rollup.covers_from, rollup.done_until, rollup.ready = start, done_until, True
+
+            flux = service._history_flux("s0", None, None, "90m", "10m", "mean")
+            raw = await service._run_query(flux)
+            mixed = await service._run_query(service._history_flux("s0", None, None, "90m", "10m", "mean", rollup=rollup))
+            return raw, mixed
+        finally:
+            buckets_api = service.client.buckets_api()
+            for name in (bucket, rollup.bucket):
+                found = buckets_api.find_bucket_by_name(name)
+                if found is not None:
+                    buckets_api.delete_bucket(found)
+
+    try:
+        raw, mixed = asyncio.run(run())
+    finally:
+        service._query_executor.shutdown()
+        service.client.close()
+
+    raw_means, mixed_means = _window_means(raw), _window_means(mixed)
+    # The first window starts mid-minute in the raw query, only whole windows are comparable
+    first = min(raw_means)
+    assert set(raw_means) == set(mixed_means)
+    assert len(raw_means) >= 9
+    for window, value in raw_means.items():
+        if window != first:
+            assert mixed_means[window] == pytest.approx(value), window
@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from influxdb_client.client.flux_table import FluxRecord
+
+from routes.sensors import router
+from services.influx_service import influx_service
+from services.latest_store import latest_store
+
+app = FastAPI()
+app.include_router(router)
+client = TestClient(app)
+
+
+@pytest.mark.parametrize("path", ["/api/sensors/history", "/api/sensors/latest"])
+@pytest.mark.parametrize("value", ['1h) |> drop(columns: ["room"]', "1h\n", "-1h", "today"])
+def test_invalid_range_is_rejected(path, value):
+    response = client.get(path, params={"range": value})
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Invalid range")
+
+
+class FakeQueryApi:
+    """Answers every Flux query with the given records"""
+
+    def __init__(self, records):
+        self.records = records
+
+    def query_stream(self, flux_query, org=None):
+        yield from self.records
+
+
+def test_latest_rows_have_the_same_schema_from_store_and_influx(monkeypatch):
+    now = datetime.now(timezone.utc)
+    record = FluxRecord(0, {
+        "result": "_result", "table": 0, "_start": now - timedelta(hours=1), "_stop": now,
+        "_time": now - timedelta(seconds=5), "_value": 21.5, "_field": "value",
+        "_measurement": "telemetry", "room": "C4", "sensor_id": "s0", "metric": "temperature",
+    })
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(influx_service, "query_api", FakeQueryApi([record]))
+    monkeypatch.setattr(influx_service, "_query_executor", executor, raising=False)
+    monkeypatch.setattr(latest_store, "warmed", False)
+    try:
+        miss = client.get("/api/sensors/latest", params={"range": "1h"})
+    finally:
+        executor.shutdown()
+    assert miss.headers["X-Cache"] == "miss"
+
+    latest_store.update("C4", "s0", "temperature", 22.0, int(now.timestamp() * 1000))
+    monkeypatch.setattr(latest_store, "warmed", True)
+    hit = client.get("/api/sensors/latest", params={"range": "1h"})
+    assert hit.headers["X-Cache"] == "hit"
+
+    miss_row, hit_row = miss.json()["data"][0], hit.json()["data"][0]
+    assert set(miss_row) == set(hit_row)
+    assert datetime.fromisoformat(miss_row["time"].replace("Z", "+00:00")).tzinfo is not None
+    assert miss_row["time"][-1] == hit_row["time"][-1]
@@ -0,0 +1,51 @@
+import asyncio
+import json
+import time
+
+from services.dedup import DedupWindow
+from services.ingestion import TELEMETRY, IngestionPipeline
+from services.mqtt_service import MQTTService
+import websocket.ws as ws_module
+from websocket.ws import WebSocketManager
+
+
+class RecordingConnection:
+    encoding = "json"
+
+    def __init__(self):
+        self.frames = []
+
+    def enqueue(self, message, key=None):
+        self.frames.append(message)
+
+    def stop(self):
+        return True
+
+
+def test_duplicate_reading_reaches_ws_once(monkeypatch):
+    service = MQTTService()
+    monkeypatch.setattr(ws_module, "mqtt_service", service)
+    pipeline = IngestionPipeline(DedupWindow(60, 1000))
+    stored = []
+    pipeline.add_sink(stored.append)
+    service.subscribe(TELEMETRY.topic, pipeline.handler(TELEMETRY))
+    manager = WebSocketManager()
+    connection = RecordingConnection()
+
+    async def run():
+        manager.initialize()
+        websocket = object()
+        manager.clients[websocket] = connection
+        manager._subscribe(websocket, "sensors/#")
+        raw = json.dumps({
+            "room": "C4", "sensor_id": "s0", "metric": "temperature", "value": 21.5, "ts": 1700000000000
+        }).encode()
+        service._dispatch("sensors/s0/telemetry", raw, time.monotonic())
+        service._dispatch("sensors/s0/telemetry", raw, time.monotonic())
+        await asyncio.sleep(0.05)
+        manager.close()
+
+    asyncio.run(run())
+    assert len(stored) == 1
+    assert len(connection.frames) == 1
+    assert json.loads(connection.frames[0])["data"]["value"] == 21.5
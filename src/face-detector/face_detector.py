@@ -16,6 +16,7 @@ Endpoints:
   /stream/nightvision  -> green boost
   /stream/thermal      -> thermal palette
   /stream/highcontrast -> CLAHE
+  /snapshot/<filter>   -> latest frame as a single JPEG (raw by default)
   /health              -> {"status":"ok"}
   /filters             -> JSON list of filters
 """
@@ -47,6 +48,31 @@ class MJPEGStreamHandler(BaseHTTPRequestHandler):
                 return f
         return None
 
+    def _get_snapshot_filter(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if path == "/snapshot":
+            return "raw"
+        for f in FaceDetector.FILTERS:
+            if path == f"/snapshot/{f}":
+                return f
+        return None
+
+    def _send_snapshot(self, filt):
+        data, v = self.server.get_jpeg(filt)
+        if not data:
+            self.send_response(503)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("X-Frame-Version", str(v))
+        self.send_header("X-Timestamp", str(self.server.frame_ts))
+        self.send_header("Cache-Control", "no-cache, no-store")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(data)
+
     def _send_mjpeg(self, filt):
         self.send_response(200)
         self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=BoundaryString")
@@ -59,7 +85,10 @@ class MJPEGStreamHandler(BaseHTTPRequestHandler):
                 data, v = self.server.get_jpeg(filt)
                 if data and v != last_v:
                     last_v = v
+                    faces = ";".join(f"{x},{y},{w},{h}" for x, y, w, h in self.server.detector.faces)
                     self.wfile.write(b"--BoundaryString\r\nContent-Type: image/jpeg\r\n")
+                    self.wfile.write(f"X-Frame-Version: {v}\r\nX-Timestamp: {self.server.frame_ts}\r\n".encode())
+                    self.wfile.write(f"X-Faces: {faces}\r\n".encode())
                     self.wfile.write(f"Content-Length: {len(data)}\r\n\r\n".encode())
                     self.wfile.write(data)
                     self.wfile.write(b"\r\n")
@@ -74,6 +103,9 @@ class MJPEGStreamHandler(BaseHTTPRequestHandler):
             filt = self._get_filter()
             if filt is not None:
                 return self._send_mjpeg(filt)
+            snap = self._get_snapshot_filter()
+            if snap is not None:
+                return self._send_snapshot(snap)
             if self.path == "/health":
                 self.send_response(200)
                 self.send_header("Content-Type", "application/json")
@@ -219,6 +251,7 @@ class FaceDetector:
                 self.detector = det
                 self.current_frame = None
                 self.ver = 0
+                self.frame_ts = 0
                 self.cache = {}
                 self.lock = threading.Lock()
                 self.running = True
@@ -247,6 +280,7 @@ class FaceDetector:
         print(f"Stream hub on http://0.0.0.0:{self.http_port}", flush=True)
         print("  /stream/raw  -> raw (fan-out)", flush=True)
         print("  /stream/blur -> face blur", flush=True)
+        print("  /snapshot/<filter> -> latest frame", flush=True)
 
     def read_esp32(self):
         sess = requests.Session()
@@ -280,6 +314,7 @@ class FaceDetector:
                             self.detect(frame)
                         self.frame = frame
                         self.server.current_frame = frame
+                        self.server.frame_ts = int(time.time() * 1000)
                         self.server.ver += 1
                         self.count += 1
                         yield frame
@@ -14,15 +14,24 @@ export const useSensorData = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const hasLoadedRef = useRef(false);
+  // ETag of the last response, the backend answers 304 while nothing new was ingested
+  const etagRef = useRef<string | null>(null);
 
   const fetchLatestValues = async (): Promise<
-    Record<SensorType, number | null>
+    Record<SensorType, number | null> | null
   > => {
     try {
       const url = `${API_ENDPOINTS.sensorsLatest}?range=1h`;
       console.log("🔍 Fetching from URL:", url);
-      const response = await fetch(url);
+      const headers: Record<string, string> = {};
+      if (etagRef.current) {
+        headers["If-None-Match"] = etagRef.current;
+      }
+      const response = await fetch(url, { headers });
       console.log("📡 Response status:", response.status, response.statusText);
+      if (response.status === 304) {
+        return null;
+      }
       console.log(
         "📡 Response headers:",
         JSON.stringify(Object.fromEntries(response.headers.entries())),
@@ -31,6 +40,7 @@ export const useSensorData = () => {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
       const result = await response.json();
+      etagRef.current = response.headers.get("ETag");
       const rows = Array.isArray(result?.data) ? result.data : [];
 
       const latest: Record<SensorType, number | null> = {
@@ -72,6 +82,10 @@ export const useSensorData = () => {
         setLoading(true);
       }
       const latest = await fetchLatestValues();
+      if (latest === null) {
+        setError(null);
+        return;
+      }
 
       setData((prev) => {
         const next = {